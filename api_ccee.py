@@ -0,0 +1,330 @@
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlencode, urlparse
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+from base_ccee import gravar_parquet, normalizar_dados, selecionar_colunas_analise
+from cache_ccee import cache_limitado
+
+# ------- CLIENTE HTTP COMPARTILHADO -------
+
+# Conexões mantidas abertas por host e limite de requisições simultâneas por host
+TAMANHO_POOL = 8
+MAX_REQUISICOES_POR_HOST = 4
+
+_sessao = None
+_semaforos_por_host = {}
+_trava = threading.Lock()
+
+
+def obter_sessao():
+    """Sessão HTTP única do processo, com pool de conexões keep-alive e compressão gzip."""
+    global _sessao
+    with _trava:
+        if _sessao is None:
+            sessao = requests.Session()
+            adaptador = HTTPAdapter(pool_connections=4, pool_maxsize=TAMANHO_POOL)
+            sessao.mount("https://", adaptador)
+            sessao.mount("http://", adaptador)
+            sessao.headers.update({"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"})
+            _sessao = sessao
+    return _sessao
+
+
+def requisitar(url, timeout=30, **kwargs):
+    """GET pela sessão compartilhada, respeitando o limite de requisições simultâneas por host."""
+    host = urlparse(url).netloc
+    with _trava:
+        semaforo = _semaforos_por_host.setdefault(host, threading.BoundedSemaphore(MAX_REQUISICOES_POR_HOST))
+    with semaforo:
+        return obter_sessao().get(url, timeout=timeout, **kwargs)
+
+
+# ------- CONSULTAS À API DE DADOS ABERTOS DA CCEE -------
+
+LIMITE_POR_PAGINA = 1000
+MAX_REQUISICOES_PARALELAS = MAX_REQUISICOES_POR_HOST
+
+
+def montar_consulta(url, filtros=None, campos=None, **params):
+    """Acrescenta filtros exatos (filters) e projeção de colunas (fields) à URL de datastore_search.
+
+    Em filtros, uma lista de valores equivale a um IN no servidor.
+    """
+    extras = {}
+    if filtros:
+        extras["filters"] = json.dumps(filtros, ensure_ascii=False)
+    if campos:
+        extras["fields"] = ",".join(campos)
+    extras.update(params)
+    return f"{url}&{urlencode(extras)}" if extras else url
+
+
+@cache_limitado(ttl=3600)  # O esquema do recurso pode mudar: relido no máximo a cada hora
+def obter_campos(url):
+    """Nomes das colunas do recurso, lidos de uma consulta sem registros.
+
+    Uma resposta sem sucesso (o CKAN responde 200 com success=false) ou sem colunas é
+    um erro, e não fica no cache: a próxima consulta pergunta de novo.
+    """
+    response = requisitar(f"{url}&limit=0")
+    response.raise_for_status()
+    dados = response.json()
+    campos = tuple(campo["id"] for campo in dados.get("result", {}).get("fields", []))
+    if not dados.get("success") or not campos:
+        raise requests.exceptions.RequestException(f"A API não informou as colunas do recurso: {dados.get('error', 'resposta vazia')}")
+    return campos
+
+
+def meses_no_periodo(ano, data_inicio=None, data_fim=None):
+    """Meses do ano do recurso (formato AAAAMM da API) que caem dentro do período."""
+    inicio = max(pd.Timestamp(data_inicio or f"{ano}-01-01"), pd.Timestamp(f"{ano}-01-01"))
+    fim = min(pd.Timestamp(data_fim or f"{ano}-12-31"), pd.Timestamp(f"{ano}-12-31"))
+    return [mes.strftime("%Y%m") for mes in pd.period_range(inicio, fim, freq="M")] if inicio <= fim else []
+
+
+def buscar_pagina(url, offset, limit=LIMITE_POR_PAGINA, timeout=30):
+    """Busca uma página de uma consulta datastore_search e retorna o bloco "result"."""
+    response = requisitar(f"{url}&limit={limit}&offset={offset}", timeout=timeout)
+    response.raise_for_status()
+    return response.json().get("result", {})
+
+
+def buscar_registros(url, limit=LIMITE_POR_PAGINA, max_requests=None, max_workers=MAX_REQUISICOES_PARALELAS):
+    """Busca todas as páginas de uma consulta, mantendo a ordem dos registros.
+
+    A primeira página informa o total de registros; as demais são buscadas em paralelo
+    com no máximo max_workers requisições simultâneas. max_requests=None busca todas
+    as páginas. Erros de rede são propagados.
+    """
+    primeira = buscar_pagina(url, 0, limit)
+    registros = list(primeira.get("records", []))
+    total = primeira.get("total")
+
+    if len(registros) < limit:
+        return registros
+
+    if total is None:
+        # Sem o total não há como saber os offsets: seguir página a página até uma página incompleta
+        offset = limit
+        while max_requests is None or offset < limit * max_requests:
+            pagina = buscar_pagina(url, offset, limit).get("records", [])
+            registros.extend(pagina)
+            if len(pagina) < limit:
+                break
+            offset += limit
+        return registros
+
+    fim = total if max_requests is None else min(total, limit * max_requests)
+    offsets = list(range(limit, fim, limit))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # executor.map devolve as páginas na ordem dos offsets
+        for pagina in executor.map(lambda offset: buscar_pagina(url, offset, limit), offsets):
+            registros.extend(pagina.get("records", []))
+
+    return registros
+
+
+# ------- AGREGAÇÃO NO SERVIDOR (datastore_search_sql) -------
+
+# Agrupamento mínimo para o gráfico; SUBMERCADO e SIGLA_PARCELA_CARGA podem ser acrescentados
+AGRUPAMENTO_MENSAL = ("NOME_EMPRESARIAL", "MES_REFERENCIA")
+
+
+def obter_resource_id(url):
+    """resource_id de uma URL de datastore_search."""
+    return dict(parse_qsl(urlparse(url).query))["resource_id"]
+
+
+def literal_sql(valor):
+    """Literal de texto SQL com aspas simples escapadas."""
+    return "'" + str(valor).replace("'", "''") + "'"
+
+
+def montar_sql_agregado(resource_id, agrupar_por, colunas_consumo, filtros=None):
+    """Monta o SELECT ... GROUP BY que soma o consumo no servidor."""
+    selecao = [f'"{col}"' for col in agrupar_por]
+    selecao += [f'SUM(CAST("{col}" AS numeric)) AS "{col}"' for col in colunas_consumo]
+    selecao.append('COUNT(*) AS "REGISTROS"')
+
+    condicoes = []
+    for col, valores in (filtros or {}).items():
+        valores = valores if isinstance(valores, (list, tuple)) else [valores]
+        condicoes.append(f'"{col}" IN ({", ".join(literal_sql(v) for v in valores)})')
+
+    sql = f'SELECT {", ".join(selecao)} FROM "{resource_id}"'
+    if condicoes:
+        sql += " WHERE " + " AND ".join(condicoes)
+    return sql + " GROUP BY " + ", ".join(f'"{col}"' for col in agrupar_por)
+
+
+def agregar_consumo(url, agrupar_por=AGRUPAMENTO_MENSAL, filtros=None):
+    """Soma o consumo por agrupamento direto no servidor, via datastore_search_sql.
+
+    Se o endpoint SQL estiver desabilitado no servidor, busca as páginas filtradas
+    (só com as colunas do agrupamento e de consumo) e agrega localmente. O resultado
+    tem as colunas de agrupamento, as colunas de consumo somadas e REGISTROS.
+    """
+    agrupar_por = list(agrupar_por)
+    colunas_consumo = [col for col in obter_campos(url) if "CONSUMO" in col.upper() and "TOTAL" in col.upper()]
+
+    endpoint = url.partition("?")[0]
+    sql = montar_sql_agregado(obter_resource_id(url), agrupar_por, colunas_consumo, filtros)
+
+    response = requisitar(f"{endpoint}_sql?{urlencode({'sql': sql})}")
+    if response.status_code >= 500:
+        response.raise_for_status()
+    if response.ok and response.json().get("success"):
+        return pd.DataFrame(response.json().get("result", {}).get("records", []))
+
+    # SQL desabilitado (403/400): paginação filtrada e agregação local
+    df = pd.DataFrame(buscar_registros(montar_consulta(url, filtros, agrupar_por + colunas_consumo)))
+    if df.empty:
+        return df
+    for col in colunas_consumo:
+        df[col] = pd.to_numeric(df[col], errors="coerce")
+    agregacoes = {col: (col, "sum") for col in colunas_consumo}
+    agregacoes["REGISTROS"] = (agrupar_por[0], "size")
+    return df.groupby(agrupar_por, dropna=False).agg(**agregacoes).reset_index()
+
+
+# ------- SNAPSHOT LOCAL DO RECURSO DO ANO CORRENTE -------
+
+# Um arquivo Parquet normalizado por mês (AAAAMM.parquet) e o estado da última sincronização
+PASTA_SNAPSHOT = "dados_ccee_api"
+ARQUIVO_ESTADO = "estado.json"
+
+_travas_snapshot = {}
+_sincronizacoes_iniciais = set()
+
+
+def pasta_snapshot(url, pasta=PASTA_SNAPSHOT):
+    """Pasta do snapshot de um recurso, identificada pelo resource_id."""
+    return os.path.join(pasta, obter_resource_id(url))
+
+
+def arquivos_snapshot(url, pasta=PASTA_SNAPSHOT):
+    """Arquivos mensais já sincronizados do recurso (lista vazia se ainda não houver snapshot completo)."""
+    pasta_recurso = pasta_snapshot(url, pasta)
+    if not os.path.isdir(pasta_recurso):
+        return []
+
+    # Primeira sincronização ainda em andamento (ou interrompida): os meses já baixados não bastam
+    if "sincronizado_em" not in ler_estado_snapshot(pasta_recurso):
+        return []
+    return sorted(
+        os.path.join(pasta_recurso, arquivo)
+        for arquivo in os.listdir(pasta_recurso) if re.fullmatch(r"\d{6}\.parquet", arquivo)
+    )
+
+
+def ler_estado_snapshot(pasta_recurso):
+    """Estado da última sincronização: registros e consumo somado por mês."""
+    caminho = os.path.join(pasta_recurso, ARQUIVO_ESTADO)
+    if not os.path.exists(caminho):
+        return {"meses": {}}
+    with open(caminho, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def gravar_estado_snapshot(pasta_recurso, estado):
+    """Grava o estado de forma atômica (arquivo temporário + rename)."""
+    caminho = os.path.join(pasta_recurso, ARQUIVO_ESTADO)
+    with open(f"{caminho}.tmp", "w", encoding="utf-8") as f:
+        json.dump(estado, f, ensure_ascii=False, indent=2)
+    os.replace(f"{caminho}.tmp", caminho)
+
+
+def sincronizar_snapshot(url, pasta=PASTA_SNAPSHOT):
+    """Atualiza o snapshot local baixando apenas os meses novos ou revisados.
+
+    O resumo por mês (registros e consumo somado) vem de uma única consulta agregada;
+    só os meses cujo resumo difere do estado local são baixados de novo e regravados.
+    Meses que sumiram do recurso são removidos, mas um resumo vazio com meses já sincronizados
+    levanta RequestException e não apaga nada. Retorna a lista de meses atualizados.
+    """
+    pasta_recurso = pasta_snapshot(url, pasta)
+    with _trava:
+        trava = _travas_snapshot.setdefault(pasta_recurso, threading.Lock())
+
+    # Uma sincronização por recurso de cada vez; quem chega depois encontra o snapshot já em dia
+    with trava:
+        os.makedirs(pasta_recurso, exist_ok=True)
+        estado = ler_estado_snapshot(pasta_recurso)
+
+        resumo = agregar_consumo(url, ("MES_REFERENCIA",))
+        remotos = {}
+        if not resumo.empty:
+            colunas_consumo = [col for col in resumo.columns if col not in ("MES_REFERENCIA", "REGISTROS")]
+            consumo = resumo[colunas_consumo].apply(pd.to_numeric, errors="coerce").sum(axis=1)
+            remotos = {
+                str(mes): {"registros": int(registros), "consumo": float(soma)}
+                for mes, registros, soma in zip(resumo["MES_REFERENCIA"], resumo["REGISTROS"], consumo)
+            }
+
+        locais = estado.get("meses", {})
+
+        # Resposta vazia com meses já sincronizados é falha da API, não um recurso esvaziado:
+        # manter o snapshot (e o sincronizado_em anterior) em vez de apagar todos os meses
+        if not remotos and locais:
+            raise requests.exceptions.RequestException("A API retornou um resumo mensal vazio")
+
+        alterados = sorted(
+            mes for mes, info in remotos.items()
+            if mes not in locais
+            or locais[mes]["registros"] != info["registros"]
+            or abs(locais[mes]["consumo"] - info["consumo"]) > 1e-6 * max(1.0, abs(info["consumo"]))
+        )
+
+        for mes in set(locais) - set(remotos):
+            arquivo = os.path.join(pasta_recurso, f"{mes}.parquet")
+            if os.path.exists(arquivo):
+                os.remove(arquivo)
+            del locais[mes]
+
+        campos = selecionar_colunas_analise(obter_campos(url))
+        for mes in alterados:
+            df = pd.DataFrame(buscar_registros(montar_consulta(url, {"MES_REFERENCIA": [mes]}, campos)))
+            gravar_parquet(normalizar_dados(df), os.path.join(pasta_recurso, f"{mes}.parquet"))
+
+            # Estado gravado a cada mês: uma sincronização interrompida não perde o que já foi baixado
+            locais[mes] = remotos[mes]
+            estado["meses"] = locais
+            gravar_estado_snapshot(pasta_recurso, estado)
+
+        estado["meses"] = locais
+        estado["sincronizado_em"] = pd.Timestamp.now().isoformat(timespec="seconds")
+        gravar_estado_snapshot(pasta_recurso, estado)
+        return alterados
+
+
+def iniciar_sincronizacao_inicial(url, pasta=PASTA_SNAPSHOT, ao_concluir=None):
+    """Dispara em segundo plano a primeira sincronização do snapshot (uma única vez por processo).
+
+    ao_concluir, se informado, é chamado sem argumentos quando a sincronização termina com
+    sucesso (ex.: para atualizar o que foi calculado antes de o snapshot existir).
+    """
+    pasta_recurso = pasta_snapshot(url, pasta)
+    with _trava:
+        if pasta_recurso in _sincronizacoes_iniciais:
+            return
+        _sincronizacoes_iniciais.add(pasta_recurso)
+
+    def sincronizar():
+        try:
+            sincronizar_snapshot(url, pasta)
+        except Exception:
+            # Falhou (ex.: API fora do ar): permitir nova tentativa na próxima consulta
+            with _trava:
+                _sincronizacoes_iniciais.discard(pasta_recurso)
+            return
+        if ao_concluir:
+            ao_concluir()
+
+    threading.Thread(target=sincronizar, name="sincronizacao-snapshot", daemon=True).start()
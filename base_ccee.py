@@ -0,0 +1,680 @@
+import json
+import os
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pandas.api.types import union_categoricals
+
+# ------- NORMALIZAÇÃO DOS DADOS -------
+
+# Colunas de texto repetitivo, gravadas com codificação de dicionário (category no pandas);
+# os dicionários são globais (ver DICIONÁRIOS DE CATEGORIAS) e os códigos valem para todas as fontes
+COLUNAS_CATEGORICAS = ["NOME_EMPRESARIAL", "CIDADE", "ESTADO_UF", "SUBMERCADO", "SIGLA_PARCELA_CARGA"]
+
+# Colunas usadas pela análise; as demais não são lidas da base nem pedidas à API
+COLUNAS_ANALISE = [
+    "MES_REFERENCIA", "NOME_EMPRESARIAL", "CNPJ_CARGA", "SIGLA_PARCELA_CARGA",
+    "CIDADE", "ESTADO_UF", "SUBMERCADO", "DATA_MIGRACAO", "CAPACIDADE_CARGA"
+]
+
+# Colunas descartadas na ingestão (identificadores internos das fontes)
+COLUNAS_DESCARTADAS = ["id", "_id"]
+
+
+def eh_coluna_consumo_total(col):
+    """Identifica a coluna de consumo total (o nome varia entre as fontes da CCEE)."""
+    return "CONSUMO" in col.upper() and "TOTAL" in col.upper()
+
+
+def selecionar_colunas_analise(colunas):
+    """Filtra as colunas usadas pela análise, incluindo a coluna de consumo total."""
+    return [col for col in colunas if col in COLUNAS_ANALISE or eh_coluna_consumo_total(col)]
+
+
+def optimize_dtypes(df):
+    """Otimiza os tipos de dados para reduzir o uso de memória."""
+    if df.empty:
+        return df
+
+    tipos = estender_dicionarios({col: df[col] for col in COLUNAS_CATEGORICAS if col in df.columns})
+
+    # Modificar in-place em vez de criar uma cópia
+    for col in df.columns:
+        if col in COLUNAS_CATEGORICAS:
+            df[col] = df[col].astype(tipos[col])
+        elif df[col].dtype == 'float64':
+            df[col] = pd.to_numeric(df[col], downcast='float')
+        elif df[col].dtype == 'int64':
+            df[col] = pd.to_numeric(df[col], downcast='integer')
+
+    return df
+
+
+def concatenar_dados(dfs):
+    """Junta os quadros de todas as fontes em uma única concatenação, sem perder as colunas categóricas.
+
+    As fontes usam os dicionários globais, mas um quadro guardado em cache pode ter sido
+    criado antes de o dicionário crescer; sem unificar as categorias, o pd.concat
+    transforma as colunas categóricas em object.
+    """
+    dfs = [df for df in dfs if not df.empty]
+    if not dfs:
+        return pd.DataFrame()
+
+    for col in COLUNAS_CATEGORICAS:
+        if all(col in df.columns for df in dfs):
+            categorias = union_categoricals([df[col].astype("category") for df in dfs], ignore_order=True).categories
+            tipo = pd.CategoricalDtype(categorias)
+            dfs = [df.assign(**{col: df[col].astype(tipo)}) for df in dfs]
+
+    return pd.concat(dfs, ignore_index=True)
+
+
+def aaaamm_para_datetime(valores):
+    """Converte valores AAAAMM (número ou texto) no primeiro dia do mês, por aritmética inteira."""
+    numeros = pd.to_numeric(pd.Series(valores), errors="coerce").to_numpy(dtype="float64")
+    ano, mes = np.floor_divide(numeros, 100), np.mod(numeros, 100)
+    validos = (mes >= 1) & (mes <= 12)
+
+    # Meses desde 1970-01 viram datetime64[M] direto, sem montar nem interpretar texto
+    datas = np.full(len(numeros), np.datetime64("NaT"), dtype="datetime64[M]")
+    datas[validos] = ((ano[validos] - 1970) * 12 + mes[validos] - 1).astype("int64").astype("datetime64[M]")
+    return datas.astype("datetime64[ns]")
+
+
+def converter_mes_referencia(serie):
+    """Converte MES_REFERENCIA de qualquer fonte (AAAAMM, DD/MM/AAAA, epoch em ms ou data) para datetime.
+
+    Rotina única para a base, o snapshot e a API. Textos são interpretados só uma vez
+    por valor distinto (uma coluna de meses tem poucas dezenas de valores diferentes).
+    """
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie
+
+    if pd.api.types.is_numeric_dtype(serie):
+        # Arquivos JSON antigos gravavam a data como epoch em milissegundos; a API usa AAAAMM
+        if serie.max() > 999999:
+            return pd.to_datetime(serie, unit="ms", errors="coerce")
+        return pd.Series(aaaamm_para_datetime(serie), index=serie.index)
+
+    codigos, distintos = pd.factorize(serie)
+    texto = pd.Series(distintos).astype(str).str.strip()
+    if texto.str.fullmatch(r"\d{6}").all():
+        datas = aaaamm_para_datetime(texto)
+    else:
+        # Formato das bases anuais (DD/MM/AAAA), depois ISO; o que sobrar cai na interpretação com dia primeiro
+        convertidas = pd.to_datetime(texto, format="%d/%m/%Y", errors="coerce")
+        for formato in ["ISO8601", None]:
+            faltantes = convertidas.isna()
+            if faltantes.any():
+                convertidas[faltantes] = pd.to_datetime(texto[faltantes], format=formato, errors="coerce", dayfirst=True)
+        datas = convertidas.to_numpy(dtype="datetime64[ns]")
+
+    # Valores nulos (código -1) ficam NaT
+    datas = np.append(datas, np.datetime64("NaT", "ns"))
+    return pd.Series(datas[codigos], index=serie.index)
+
+
+def formatar_cnpj(serie):
+    """Formata CNPJs como 00.000.000/0000-00, completando zeros à esquerda."""
+    if pd.api.types.is_numeric_dtype(serie):
+        serie = serie.astype("Int64")
+    digitos = serie.astype("string").str.replace(r"\D", "", regex=True).str.zfill(14)
+    return digitos.str.replace(r"(\d{2})(\d{3})(\d{3})(\d{4})(\d{2})", r"\1.\2.\3/\4-\5", regex=True)
+
+
+def normalizar_dados(df):
+    """Aplica a normalização da base: datas reais, CNPJ formatado, consumo numérico e categorias."""
+    df = df.drop(columns=[col for col in COLUNAS_DESCARTADAS if col in df.columns])
+    if df.empty:
+        return df
+
+    if "MES_REFERENCIA" in df.columns:
+        df["MES_REFERENCIA"] = converter_mes_referencia(df["MES_REFERENCIA"])
+        df = df.dropna(subset=["MES_REFERENCIA"])
+
+    if "CNPJ_CARGA" in df.columns:
+        df["CNPJ_CARGA"] = formatar_cnpj(df["CNPJ_CARGA"]).astype(object)
+
+    return optimize_dtypes(converter_colunas_numericas(df))
+
+
+def converter_colunas_numericas(df):
+    """Converte uma única vez, na carga, as colunas de consumo e capacidade para número."""
+    for col in df.columns:
+        if ("CONSUMO" in col.upper() or col == "CAPACIDADE_CARGA") and not pd.api.types.is_numeric_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+    return df
+
+
+def calcular_consumo_mwm(df):
+    """Acrescenta HORAS_NO_MES e CONSUMO_MWm (energia do mês dividida pelas horas do mês), sem laços em Python."""
+    df["HORAS_NO_MES"] = df["MES_REFERENCIA"].dt.days_in_month * 24
+
+    col_consumo = next((col for col in df.columns if eh_coluna_consumo_total(col)), None)
+    if col_consumo:
+        consumo = df[col_consumo]
+        if not pd.api.types.is_numeric_dtype(consumo):
+            consumo = pd.to_numeric(consumo, errors="coerce")
+        df["CONSUMO_MWm"] = consumo / df["HORAS_NO_MES"]
+    return df
+
+
+# ------- BASE COLUNAR -------
+
+# Base normalizada particionada por ano (hive): dados_ccee/ANO=2024/dados.parquet
+PASTA_BASE = "dados_ccee"
+ARQUIVO_PARTICAO = "dados.parquet"
+PARTICIONAMENTO = ds.partitioning(pa.schema([("ANO", pa.int16())]), flavor="hive")
+
+# Arquivos anuais avulsos, anteriores à base particionada
+PADRAO_ARQUIVO_ANUAL = re.compile(r"base_de_dados_nacional_(\d{4})\.parquet")
+
+
+def gravar_parquet(df, arquivo, linhas_por_grupo=50_000, nivel_compressao=9):
+    """Grava um DataFrame normalizado em Parquet, ordenado por empresa e mês.
+
+    A gravação é feita em um arquivo temporário e depois renomeada, para que
+    leitores simultâneos nunca vejam um arquivo pela metade.
+    """
+    # Ordenar por empresa e mês deixa cada row group com poucas empresas,
+    # o que torna as estatísticas do Parquet úteis para o filtro por empresa
+    df = df.sort_values([col for col in ["NOME_EMPRESARIAL", "MES_REFERENCIA"] if col in df.columns])
+    # O dicionário global inteiro iria para cada arquivo; só os valores presentes são gravados
+    for col in df.select_dtypes("category").columns:
+        df[col] = df[col].cat.remove_unused_categories()
+    tabela = pa.Table.from_pandas(df, preserve_index=False)
+    if "MES_REFERENCIA" in tabela.schema.names:
+        idx_data = tabela.schema.get_field_index("MES_REFERENCIA")
+        tabela = tabela.set_column(idx_data, "MES_REFERENCIA", tabela.column(idx_data).cast(pa.date32()))
+
+    os.makedirs(os.path.dirname(arquivo) or ".", exist_ok=True)
+    # Prefixo ".": arquivos ocultos são ignorados na descoberta de datasets do pyarrow
+    temporario = os.path.join(os.path.dirname(arquivo), f".{os.path.basename(arquivo)}.tmp")
+    pq.write_table(
+        tabela, temporario,
+        row_group_size=linhas_por_grupo,
+        compression="zstd",
+        compression_level=nivel_compressao,
+    )
+    os.replace(temporario, arquivo)
+    return arquivo
+
+
+def escrever_base(df, pasta_saida=PASTA_BASE, linhas_por_grupo=50_000, nivel_compressao=9):
+    """Grava a base normalizada em uma partição por ano, ordenada por empresa e mês."""
+    arquivos = []
+
+    # Cada ano é substituído por inteiro; partições de outros anos não são tocadas
+    for ano, df_ano in df.groupby(df["MES_REFERENCIA"].dt.year, sort=True):
+        arquivo = os.path.join(pasta_saida, f"ANO={int(ano)}", ARQUIVO_PARTICAO)
+        arquivos.append(gravar_parquet(df_ano, arquivo, linhas_por_grupo, nivel_compressao))
+
+    return arquivos
+
+
+def abrir_base(pasta=PASTA_BASE):
+    """Descobre a base local e a abre como um único dataset pyarrow.
+
+    Usa a base particionada quando existir; caso contrário, reúne os arquivos anuais
+    avulsos encontrados na pasta atual. Retorna None se não houver dados locais.
+    Na base particionada, só os arquivos ARQUIVO_PARTICAO entram: temporários deixados
+    por uma gravação interrompida nunca são lidos.
+    """
+    if os.path.isdir(pasta):
+        arquivos = sorted(
+            os.path.join(pasta, particao, ARQUIVO_PARTICAO) for particao in os.listdir(pasta)
+            if os.path.isfile(os.path.join(pasta, particao, ARQUIVO_PARTICAO))
+        )
+        if arquivos:
+            return ds.dataset(arquivos, format="parquet", partitioning=PARTICIONAMENTO, partition_base_dir=pasta)
+
+    arquivos = sorted(arquivo for arquivo in os.listdir(".") if PADRAO_ARQUIVO_ANUAL.fullmatch(arquivo))
+    if arquivos:
+        return ds.dataset(arquivos, format="parquet")
+    return None
+
+
+def ano_do_arquivo(arquivo):
+    """Ano de um arquivo da base, pela partição (ANO=AAAA) ou pelo nome do arquivo anual."""
+    ano = re.search(r"ANO=(\d{4})", arquivo) or re.search(r"(\d{4})", os.path.basename(arquivo))
+    return int(ano.group(1)) if ano else 0
+
+
+# ------- CATÁLOGO DE EMPRESAS -------
+
+# Catálogo persistido: uma linha por empresa e arquivo de origem
+ARQUIVO_CATALOGO = "catalogo_empresas.parquet"
+CHAVE_FONTES_CATALOGO = b"fontes_catalogo"
+
+
+def impressao_digital(arquivo):
+    """Identifica a versão de um arquivo pelo tamanho e data de modificação."""
+    stat = os.stat(arquivo)
+    return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+
+def resumir_arquivo_empresas(arquivo):
+    """Resume um arquivo Parquet por empresa lendo apenas as colunas de nome e CNPJ."""
+    schema = pq.read_schema(arquivo)
+    colunas = [col for col in ["NOME_EMPRESARIAL", "CNPJ_CARGA"] if col in schema.names]
+    if "NOME_EMPRESARIAL" not in colunas:
+        return pd.DataFrame(columns=["NOME_EMPRESARIAL", "FONTE", "ANO", "RAIZES_CNPJ", "REGISTROS"])
+
+    df = pq.read_table(arquivo, columns=colunas, read_dictionary=colunas).to_pandas()
+    resumo = df.groupby("NOME_EMPRESARIAL", observed=True).size().rename("REGISTROS").reset_index()
+    resumo["NOME_EMPRESARIAL"] = resumo["NOME_EMPRESARIAL"].astype(str)
+
+    # Raiz do CNPJ (8 primeiros dígitos), calculada apenas sobre os pares distintos empresa/CNPJ
+    if "CNPJ_CARGA" in df.columns:
+        pares = df.drop_duplicates().dropna(subset=["CNPJ_CARGA"])
+        pares["RAIZ"] = pares["CNPJ_CARGA"].astype(str).str.replace(r"\D", "", regex=True).str[:8]
+        raizes = pares.groupby("NOME_EMPRESARIAL", observed=True)["RAIZ"].agg(lambda x: ";".join(sorted(set(x))))
+        raizes.index = raizes.index.astype(str)
+        resumo["RAIZES_CNPJ"] = resumo["NOME_EMPRESARIAL"].map(raizes).fillna("")
+    else:
+        resumo["RAIZES_CNPJ"] = ""
+
+    resumo["FONTE"] = arquivo
+    resumo["ANO"] = ano_do_arquivo(arquivo)
+    return resumo[["NOME_EMPRESARIAL", "FONTE", "ANO", "RAIZES_CNPJ", "REGISTROS"]]
+
+
+def ler_catalogo_persistido(caminho_catalogo=ARQUIVO_CATALOGO):
+    """Lê o catálogo persistido e as impressões digitais dos arquivos que o geraram."""
+    if not os.path.exists(caminho_catalogo):
+        return pd.DataFrame(), {}
+
+    tabela = pq.read_table(caminho_catalogo)
+    metadados = tabela.schema.metadata or {}
+    fontes = json.loads(metadados.get(CHAVE_FONTES_CATALOGO, b"{}"))
+    return tabela.to_pandas(), fontes
+
+
+def atualizar_catalogo(arquivos, caminho_catalogo=ARQUIVO_CATALOGO):
+    """Atualiza o catálogo persistido, reprocessando apenas os arquivos novos ou alterados."""
+    try:
+        detalhe, fontes = ler_catalogo_persistido(caminho_catalogo)
+    except Exception:
+        # Catálogo corrompido ou de formato antigo: reconstruir do zero
+        detalhe, fontes = pd.DataFrame(), {}
+
+    arquivos = [os.path.normpath(arquivo) for arquivo in arquivos]
+    fontes_atuais = {arquivo: impressao_digital(arquivo) for arquivo in arquivos if os.path.exists(arquivo)}
+    alteradas = [arquivo for arquivo, digital in fontes_atuais.items() if fontes.get(arquivo) != digital]
+    removidas = set(fontes) - set(fontes_atuais)
+
+    if not alteradas and not removidas:
+        return detalhe
+
+    partes = [resumir_arquivo_empresas(arquivo) for arquivo in alteradas]
+    if not detalhe.empty:
+        partes.insert(0, detalhe[~detalhe["FONTE"].isin(set(alteradas) | removidas)])
+    detalhe = pd.concat(partes, ignore_index=True) if partes else pd.DataFrame()
+
+    # Persistir junto com as impressões digitais; se o diretório for somente leitura, seguir em memória
+    try:
+        tabela = pa.Table.from_pandas(detalhe, preserve_index=False)
+        tabela = tabela.replace_schema_metadata({CHAVE_FONTES_CATALOGO: json.dumps(fontes_atuais).encode()})
+        pq.write_table(tabela, caminho_catalogo, compression="zstd")
+    except OSError:
+        pass
+
+    return detalhe
+
+
+def resumir_catalogo(detalhe):
+    """Consolida o catálogo por empresa: raízes de CNPJ, anos presentes e total de registros."""
+    if detalhe.empty:
+        return pd.DataFrame(columns=["NOME_EMPRESARIAL", "RAIZES_CNPJ", "ANOS", "REGISTROS"])
+
+    catalogo = detalhe.groupby("NOME_EMPRESARIAL", sort=True).agg(
+        RAIZES_CNPJ=("RAIZES_CNPJ", lambda x: ";".join(sorted({r for v in x for r in v.split(";") if r}))),
+        ANOS=("ANO", lambda x: sorted(set(x))),
+        REGISTROS=("REGISTROS", "sum")
+    ).reset_index()
+    return catalogo
+
+
+# ------- DICIONÁRIOS DE CATEGORIAS -------
+
+# Valores de cada coluna categórica, na ordem dos códigos. O arquivo é criado na ingestão e
+# depois só recebe valores novos no fim, então um valor gravado mantém o mesmo código para sempre
+ARQUIVO_DICIONARIOS = "dicionarios_ccee.json"
+
+_dicionarios = {}  # caminho -> {"tipos": {coluna: pd.CategoricalDtype}, "versao": versão do arquivo lido, "pendente": bool}
+_trava_dicionarios = threading.Lock()
+
+
+def ler_dicionarios(caminho=ARQUIVO_DICIONARIOS):
+    """Lê os dicionários persistidos ({coluna: [valores]}); vazio se o arquivo não existir ou estiver corrompido."""
+    try:
+        with open(caminho, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def gravar_dicionarios(tipos, caminho=ARQUIVO_DICIONARIOS):
+    """Grava os dicionários de forma atômica (arquivo temporário + rename)."""
+    temporario = f"{caminho}.tmp"
+    with open(temporario, "w", encoding="utf-8") as f:
+        json.dump({col: tipo.categories.tolist() for col, tipo in tipos.items()}, f, ensure_ascii=False)
+    os.replace(temporario, caminho)
+
+
+def _versao_arquivo(caminho):
+    try:
+        return impressao_digital(caminho)
+    except OSError:
+        return None
+
+
+def _sincronizar_dicionarios(caminho):
+    """Incorpora os valores gravados por outros processos (ingestão, outras instâncias do app).
+
+    Chamada com a trava. A ordem do arquivo prevalece; os valores que só este processo
+    conhece vão para depois dos gravados e mudam de código se outro processo tiver
+    gravado valores novos antes (por isso só os valores gravados têm código definitivo).
+    """
+    estado = _dicionarios.setdefault(caminho, {"tipos": {}, "versao": None, "pendente": False})
+    versao = _versao_arquivo(caminho)
+    if versao is None or versao == estado["versao"]:
+        return estado
+
+    persistidos = ler_dicionarios(caminho)
+    tipos = estado["tipos"]
+    for col in list(persistidos) + [col for col in tipos if col not in persistidos]:
+        gravados = pd.Index(persistidos.get(col, []), dtype=object)
+        if col in tipos and tipos[col].categories[:len(gravados)].equals(gravados):
+            continue
+        em_memoria = tipos[col].categories if col in tipos else pd.Index([], dtype=object)
+        extras = em_memoria.difference(gravados, sort=False)
+        tipos[col] = pd.CategoricalDtype(gravados.append(extras))
+        estado["pendente"] = estado["pendente"] or len(extras) > 0
+    estado["versao"] = versao
+    return estado
+
+
+def dicionarios_globais(caminho=ARQUIVO_DICIONARIOS):
+    """Tipos categóricos atuais ({coluna: CategoricalDtype}), sem acrescentar nem gravar nada."""
+    with _trava_dicionarios:
+        return dict(_sincronizar_dicionarios(caminho)["tipos"])
+
+
+def estender_dicionarios(valores_por_coluna, caminho=ARQUIVO_DICIONARIOS, persistir=False):
+    """Acrescenta ao fim dos dicionários os valores ainda desconhecidos e retorna {coluna: CategoricalDtype}.
+
+    Os valores novos de cada chamada entram em ordem alfabética, depois de todos os anteriores.
+    Sem persistir (caminho das consultas), a extensão fica só na memória do processo; com
+    persistir (ingestão e montagem da tabela compartilhada), os valores pendentes são gravados.
+    """
+    with _trava_dicionarios:
+        estado = _sincronizar_dicionarios(caminho)
+        tipos = estado["tipos"]
+
+        for col, valores in valores_por_coluna.items():
+            conhecidos = tipos[col].categories if col in tipos else pd.Index([], dtype=object)
+            presentes = pd.Index(pd.unique(np.asarray(pd.Series(valores).dropna(), dtype=object)))
+            novos = presentes.difference(conhecidos, sort=False)
+            if len(novos) or col not in tipos:
+                tipos[col] = pd.CategoricalDtype(conhecidos.append(novos.sort_values(key=lambda indice: indice.astype(str))))
+                estado["pendente"] = True
+
+        # Se o diretório for somente leitura, os dicionários continuam valendo para este processo
+        if persistir and estado["pendente"]:
+            try:
+                gravar_dicionarios(tipos, caminho)
+                estado["versao"] = _versao_arquivo(caminho)
+                estado["pendente"] = False
+            except OSError:
+                pass
+        return dict(tipos)
+
+
+# ------- TABELA COMPARTILHADA -------
+
+# Cópia descompactada da base em Arrow IPC, aberta por memory map: as páginas ficam no cache
+# do sistema operacional e são compartilhadas por todas as sessões (e processos) do app
+ARQUIVO_TABELA = "base_ccee.arrow"
+CHAVE_FONTES_TABELA = b"fontes_tabela"
+
+
+def ler_tabela_arquivo(arquivo):
+    """Lê as colunas de análise de um arquivo Parquet, com as colunas categóricas codificadas por dicionário."""
+    colunas = selecionar_colunas_analise(pq.read_schema(arquivo).names)
+    categoricas = [col for col in COLUNAS_CATEGORICAS if col in colunas]
+    tabela = pq.read_table(arquivo, columns=colunas, read_dictionary=categoricas)
+
+    # Arquivo ainda não compilado por ingestao_ccee.py: normalizar antes de juntar
+    if "MES_REFERENCIA" in tabela.schema.names and not pa.types.is_temporal(tabela.schema.field("MES_REFERENCIA").type):
+        tabela = pa.Table.from_pandas(normalizar_dados(tabela.to_pandas()), preserve_index=False)
+
+    if "MES_REFERENCIA" in tabela.schema.names:
+        idx = tabela.schema.get_field_index("MES_REFERENCIA")
+        tabela = tabela.set_column(idx, "MES_REFERENCIA", tabela.column(idx).cast(pa.date32()))
+    return tabela
+
+
+def valores_dicionario(coluna):
+    """Valores distintos de uma coluna (pa.Array), lidos só dos dicionários quando ela é codificada."""
+    if not pa.types.is_dictionary(coluna.type):
+        return pc.unique(coluna)
+    dicionarios = [pedaco.dictionary.cast(pa.string()) for pedaco in coluna.chunks]
+    return pc.unique(pa.concat_arrays(dicionarios)) if dicionarios else pa.array([], pa.string())
+
+
+def examinar_arquivo_tabela(arquivo):
+    """Primeira passada da montagem: esquema do arquivo como será lido e valores das colunas categóricas.
+
+    De um arquivo compilado só os dicionários das colunas categóricas são lidos;
+    um arquivo antigo precisa ser normalizado para que os tipos sejam conhecidos.
+    """
+    esquema = pq.read_schema(arquivo)
+    colunas = selecionar_colunas_analise(esquema.names)
+    if "MES_REFERENCIA" in colunas and not pa.types.is_temporal(esquema.field("MES_REFERENCIA").type):
+        tabela = ler_tabela_arquivo(arquivo)
+        esquema = tabela.schema
+        valores = {col: valores_dicionario(tabela.column(col)).to_pandas() for col in COLUNAS_CATEGORICAS if col in esquema.names}
+    else:
+        # Um row group por vez, acumulando só os valores distintos (em Arrow, sem objetos Python)
+        categoricas = [col for col in COLUNAS_CATEGORICAS if col in colunas]
+        arquivo_parquet = pq.ParquetFile(arquivo, read_dictionary=categoricas)
+        distintos = {col: pa.array([], pa.string()) for col in categoricas}
+        for i in range(arquivo_parquet.num_row_groups):
+            grupo = arquivo_parquet.read_row_group(i, columns=categoricas)
+            for col in categoricas:
+                distintos[col] = pc.unique(pa.concat_arrays([distintos[col], valores_dicionario(grupo.column(col))]))
+        esquema = pa.schema([esquema.field(col) for col in colunas])
+        valores = {col: distintos_coluna.to_pandas() for col, distintos_coluna in distintos.items()}
+
+    # Tipos finais: as categóricas serão recodificadas com o dicionário global
+    campos = []
+    for campo in esquema:
+        if campo.name in COLUNAS_CATEGORICAS:
+            campo = pa.field(campo.name, pa.dictionary(pa.int32(), pa.string()))
+        elif campo.name == "MES_REFERENCIA":
+            campo = pa.field(campo.name, pa.date32())
+        campos.append(campo)
+
+    return pa.schema(campos), valores
+
+
+def recodificar_coluna(coluna, dicionario, linhas):
+    """Troca os códigos do dicionário próprio de cada bloco pelos códigos do dicionário global.
+
+    Só o dicionário do bloco (poucos valores) é procurado no global; os códigos das
+    linhas são traduzidos por take, sem voltar a texto.
+    """
+    if coluna is None:
+        return pa.chunked_array([pa.DictionaryArray.from_arrays(pa.nulls(linhas, pa.int32()), dicionario)])
+
+    pedacos = []
+    for pedaco in coluna.chunks:
+        if not pa.types.is_dictionary(pedaco.type):
+            pedaco = pc.dictionary_encode(pedaco)
+        mapa = pc.index_in(pedaco.dictionary.cast(dicionario.type), value_set=dicionario)
+        pedacos.append(pa.DictionaryArray.from_arrays(pc.take(mapa, pedaco.indices), dicionario))
+    return pa.chunked_array(pedacos, type=pa.dictionary(pa.int32(), dicionario.type))
+
+
+def ler_lote_tabela(arquivo, esquema, dicionarios):
+    """Segunda passada: um arquivo no esquema unificado, com os códigos globais e ordenado por empresa e mês."""
+    tabela = ler_tabela_arquivo(arquivo)
+    colunas = []
+    for campo in esquema:
+        coluna = tabela.column(campo.name) if campo.name in tabela.schema.names else None
+        if campo.name in dicionarios:
+            coluna = recodificar_coluna(coluna, dicionarios[campo.name], tabela.num_rows)
+        elif coluna is None:
+            coluna = pa.nulls(tabela.num_rows, campo.type)
+        elif coluna.type != campo.type:
+            coluna = coluna.cast(campo.type)
+        colunas.append(coluna)
+    lote = pa.table(colunas, schema=esquema)
+
+    # Ordenar pelo código inteiro da empresa e pelo mês: cada empresa vira um intervalo do lote
+    chaves = {}
+    if "NOME_EMPRESARIAL" in esquema.names:
+        chaves["empresa"] = pa.chunked_array([pedaco.indices for pedaco in lote.column("NOME_EMPRESARIAL").chunks], pa.int32())
+    if "MES_REFERENCIA" in esquema.names:
+        chaves["mes"] = lote.column("MES_REFERENCIA")
+    if chaves:
+        ordem = pc.sort_indices(pa.table(chaves), sort_keys=[(chave, "ascending") for chave in chaves])
+        lote = lote.take(ordem)
+    return lote
+
+
+def montar_tabela(arquivos):
+    """Prepara a montagem da tabela sem carregar a base inteira na memória.
+
+    Retorna o esquema unificado e um gerador de lotes, um por arquivo de origem, todos
+    codificados com os mesmos dicionários globais (gravados antes do primeiro lote).
+    """
+    exames = [examinar_arquivo_tabela(arquivo) for arquivo in arquivos]
+    esquema = pa.unify_schemas([esquema for esquema, _ in exames], promote_options="permissive")
+
+    valores = {}
+    for _, valores_arquivo in exames:
+        for col, serie in valores_arquivo.items():
+            valores.setdefault(col, []).append(serie)
+    tipos = estender_dicionarios({col: pd.concat(series, ignore_index=True) for col, series in valores.items()}, persistir=True)
+
+    dicionarios = {
+        col: pa.array(tipos[col].categories.to_numpy(dtype=object), type=pa.string())
+        for col in COLUNAS_CATEGORICAS if col in esquema.names
+    }
+
+    def gerar_lotes():
+        for arquivo in arquivos:
+            lote = ler_lote_tabela(arquivo, esquema, dicionarios)
+            if lote.num_rows:
+                yield lote
+
+    return esquema, gerar_lotes()
+
+
+def usa_dicionarios_globais(tabela):
+    """Indica se os dicionários da tabela coincidem com o início dos dicionários globais (somente leitura)."""
+    tipos = dicionarios_globais()
+    for campo in tabela.schema:
+        if campo.name in COLUNAS_CATEGORICAS and pa.types.is_dictionary(campo.type):
+            coluna = tabela.column(campo.name)
+            if coluna.num_chunks == 0:
+                continue
+            dicionario = pd.Index(coluna.chunk(0).dictionary.to_pandas(), dtype=object)
+            if campo.name not in tipos or not tipos[campo.name].categories[:len(dicionario)].equals(dicionario):
+                return False
+    return True
+
+
+def abrir_tabela_compartilhada(arquivos, caminho_tabela=ARQUIVO_TABELA):
+    """Abre por memory map a tabela Arrow da base, regravando-a só quando algum arquivo de origem mudar.
+
+    Retorna None se não houver arquivos.
+    """
+    arquivos = [os.path.normpath(arquivo) for arquivo in arquivos]
+    fontes_atuais = {arquivo: impressao_digital(arquivo) for arquivo in arquivos if os.path.exists(arquivo)}
+    if not fontes_atuais:
+        return None
+
+    if os.path.exists(caminho_tabela):
+        try:
+            tabela = pa.ipc.open_file(pa.memory_map(caminho_tabela)).read_all()
+            # Tabela gravada antes dos dicionários globais (ou com outros códigos) também é reconstruída
+            if json.loads((tabela.schema.metadata or {}).get(CHAVE_FONTES_TABELA, b"{}")) == fontes_atuais and usa_dicionarios_globais(tabela):
+                return tabela
+        except (OSError, pa.ArrowInvalid):
+            # Arquivo corrompido ou de formato antigo: reconstruir
+            pass
+
+    esquema, lotes = montar_tabela(list(fontes_atuais))
+    esquema = esquema.with_metadata({CHAVE_FONTES_TABELA: json.dumps(fontes_atuais).encode()})
+
+    # Um arquivo de origem por vez vai para o disco; se o diretório for somente leitura,
+    # seguir com a tabela montada em memória
+    try:
+        temporario = f"{caminho_tabela}.tmp"
+        with pa.OSFile(temporario, "wb") as saida, pa.ipc.new_file(saida, esquema) as escritor:
+            for lote in lotes:
+                escritor.write_table(lote)
+                # Devolver ao sistema a memória do lote já gravado antes de ler o próximo arquivo
+                del lote
+                pa.default_memory_pool().release_unused()
+        os.replace(temporario, caminho_tabela)
+    except OSError:
+        _, lotes = montar_tabela(list(fontes_atuais))
+        return pa.Table.from_batches([lote for tabela in lotes for lote in tabela.to_batches()], esquema)
+    return pa.ipc.open_file(pa.memory_map(caminho_tabela)).read_all()
+
+
+def indexar_empresas(tabela):
+    """Intervalos de linhas [(início, fim), ...] de cada empresa, um por lote da tabela.
+
+    Dentro de cada lote as linhas de uma empresa são contíguas e ordenadas por mês.
+    """
+    indice = {}
+    inicio = 0
+    for lote in tabela.column("NOME_EMPRESARIAL").chunks:
+        for item in pc.value_counts(lote):
+            quantidade = item["counts"].as_py()
+            indice.setdefault(item["values"].as_py(), []).append((inicio, inicio + quantidade))
+            inicio += quantidade
+    return indice
+
+
+def fatiar_tabela(tabela, indice, empresas=None, data_inicio=None, data_fim=None):
+    """Recorta as linhas das empresas e do período como fatias da tabela, sem copiar os dados.
+
+    Em cada intervalo de uma empresa as linhas estão ordenadas por mês, então o período
+    vira um sub-intervalo encontrado por busca binária.
+    """
+    inicio_periodo = pd.Timestamp(data_inicio).date() if data_inicio else None
+    fim_periodo = pd.Timestamp(data_fim).date() if data_fim else None
+
+    if not empresas:
+        # Sem seleção de empresas a tabela inteira é usada; as datas não estão em ordem global
+        mascara = pa.array(np.ones(tabela.num_rows, dtype=bool))
+        datas = tabela.column("MES_REFERENCIA")
+        if inicio_periodo is not None:
+            mascara = pc.and_(mascara, pc.greater_equal(datas, pa.scalar(inicio_periodo, pa.date32())))
+        if fim_periodo is not None:
+            mascara = pc.and_(mascara, pc.less_equal(datas, pa.scalar(fim_periodo, pa.date32())))
+        return tabela.filter(mascara)
+
+    fatias = []
+    for empresa in empresas:
+        for inicio, fim in indice.get(empresa, []):
+            datas = tabela.column("MES_REFERENCIA").slice(inicio, fim - inicio).to_numpy()
+            primeira = np.searchsorted(datas, np.datetime64(inicio_periodo, "D"), side="left") if inicio_periodo is not None else 0
+            ultima = np.searchsorted(datas, np.datetime64(fim_periodo, "D"), side="right") if fim_periodo is not None else len(datas)
+            if ultima > primeira:
+                fatias.append(tabela.slice(inicio + primeira, ultima - primeira))
+
+    return pa.concat_tables(fatias) if fatias else tabela.slice(0, 0)
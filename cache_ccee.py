@@ -0,0 +1,229 @@
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+import pandas as pd
+import pyarrow as pa
+
+# ------- CACHE EM MEMÓRIA COM ORÇAMENTO -------
+
+# Orçamento total do cache de dados, em MB (o container do app tem 1 GB)
+ORCAMENTO_CACHE_MB = int(os.environ.get("CCEE_CACHE_MB", "256"))
+
+
+def tamanho_em_bytes(valor):
+    """Estima a memória ocupada por um valor guardado no cache."""
+    if isinstance(valor, (pd.DataFrame, pd.Series)):
+        quadro = valor.to_frame() if isinstance(valor, pd.Series) else valor
+        # Colunas categóricas: só os códigos contam; as categorias são os dicionários globais,
+        # que existem uma única vez na memória e são compartilhados por todos os quadros
+        uso = quadro.index.memory_usage(deep=True)
+        for _, coluna in quadro.items():
+            if isinstance(coluna.dtype, pd.CategoricalDtype):
+                uso += coluna.cat.codes.nbytes
+            else:
+                uso += coluna.memory_usage(index=False, deep=True)
+        return int(uso)
+    if isinstance(valor, (pa.Table, pa.RecordBatch, pa.Array, pa.ChunkedArray)):
+        return int(valor.nbytes)
+    if isinstance(valor, dict):
+        return sys.getsizeof(valor) + sum(tamanho_em_bytes(k) + tamanho_em_bytes(v) for k, v in valor.items())
+    if isinstance(valor, (list, tuple, set, frozenset)):
+        return sys.getsizeof(valor) + sum(tamanho_em_bytes(v) for v in valor)
+    return sys.getsizeof(valor)
+
+
+class CacheLRU:
+    """Cache compartilhado entre sessões, limitado em bytes, que remove primeiro as entradas usadas há mais tempo."""
+
+    def __init__(self, orcamento_bytes):
+        self.orcamento_bytes = orcamento_bytes
+        self.bytes_usados = 0
+        self.acertos = 0
+        self.faltas = 0
+        self.remocoes = 0
+        self.revalidacoes = 0
+        self.coalescidas = 0
+        self._em_revalidacao = set()
+        self._em_andamento = {}  # chave -> cálculo em andamento, compartilhado por quem pedir a mesma chave
+        self._entradas = OrderedDict()  # chave -> (valor, tamanho, criado_em)
+        self._trava = threading.Lock()
+
+    def obter(self, chave, ttl=None, servir_vencido=False, contar=True):
+        """Procura a chave no cache e retorna (encontrado, valor, vencido).
+
+        Uma entrada além do ttl é descartada, a menos que servir_vencido seja verdadeiro:
+        nesse caso ela é devolvida marcada como vencida, para ser revalidada pelo chamador.
+        Com contar=False (consultas repetidas de acompanhamento), os contadores não mudam.
+        """
+        with self._trava:
+            entrada = self._entradas.get(chave)
+            vencido = entrada is not None and ttl is not None and time.monotonic() - entrada[2] > ttl
+            if vencido and not servir_vencido:
+                self._remover(chave)
+                entrada = None
+
+            if entrada is None:
+                self.faltas += contar
+                return False, None, False
+
+            self._entradas.move_to_end(chave)
+            self.acertos += contar
+            return True, entrada[0], vencido
+
+    def guardar(self, chave, valor):
+        """Guarda um valor e remove as entradas menos usadas até caber no orçamento."""
+        tamanho = tamanho_em_bytes(valor)
+        with self._trava:
+            if chave in self._entradas:
+                self._remover(chave)
+
+            # Valor maior que o orçamento inteiro: devolvido ao chamador, mas não guardado
+            if tamanho > self.orcamento_bytes:
+                return
+
+            self._entradas[chave] = (valor, tamanho, time.monotonic())
+            self.bytes_usados += tamanho
+            while self.bytes_usados > self.orcamento_bytes:
+                self._remover(next(iter(self._entradas)))
+                self.remocoes += 1
+
+    def estatisticas(self):
+        """Ocupação e contadores de acertos, faltas e remoções por falta de espaço."""
+        with self._trava:
+            return {
+                "entradas": len(self._entradas),
+                "bytes_usados": self.bytes_usados,
+                "orcamento_bytes": self.orcamento_bytes,
+                "acertos": self.acertos,
+                "faltas": self.faltas,
+                "remocoes": self.remocoes,
+                "revalidacoes": self.revalidacoes,
+                "coalescidas": self.coalescidas,
+            }
+
+    def calcular_uma_vez(self, chave, calcular):
+        """Calcula e guarda o valor da chave, com uma única execução por vez para cada chave.
+
+        Quem pedir a mesma chave enquanto o cálculo está em andamento espera por ele e recebe
+        o mesmo resultado (ou a mesma exceção). Se o cálculo for interrompido pelo Streamlit
+        (sessão encerrada ou reexecutada), quem esperava calcula por conta própria.
+        """
+        with self._trava:
+            em_andamento = self._em_andamento.get(chave)
+            if em_andamento is None:
+                em_andamento = self._em_andamento[chave] = {"pronto": threading.Event()}
+                lider = True
+            else:
+                self.coalescidas += 1
+                lider = False
+
+        if not lider:
+            em_andamento["pronto"].wait()
+            if "valor" in em_andamento:
+                return em_andamento["valor"]
+            if "erro" in em_andamento:
+                raise em_andamento["erro"]
+            return self.calcular_uma_vez(chave, calcular)
+
+        try:
+            valor = calcular()
+            self.guardar(chave, valor)
+            em_andamento["valor"] = valor
+            return valor
+        except Exception as e:
+            em_andamento["erro"] = e
+            raise
+        finally:
+            with self._trava:
+                del self._em_andamento[chave]
+            em_andamento["pronto"].set()
+
+    def revalidar(self, chave, calcular):
+        """Recalcula uma entrada vencida em segundo plano, uma única vez por chave.
+
+        Enquanto isso, o valor antigo continua sendo servido; o novo valor o substitui de
+        uma vez quando fica pronto. Se o cálculo falhar, o valor antigo é mantido e uma
+        nova tentativa ocorre no próximo acesso.
+        """
+        if self.calcular_em_segundo_plano(chave, calcular):
+            with self._trava:
+                self.revalidacoes += 1
+
+    def calcular_em_segundo_plano(self, chave, calcular):
+        """Dispara o cálculo da chave em uma thread, se ainda não houver um em segundo plano."""
+        with self._trava:
+            if chave in self._em_revalidacao:
+                return False
+            self._em_revalidacao.add(chave)
+
+        def executar():
+            try:
+                self.calcular_uma_vez(chave, calcular)
+            except Exception:
+                pass
+            finally:
+                with self._trava:
+                    self._em_revalidacao.discard(chave)
+
+        threading.Thread(target=executar, name="calculo-cache", daemon=True).start()
+        return True
+
+    def _remover(self, chave):
+        _, tamanho, _ = self._entradas.pop(chave)
+        self.bytes_usados -= tamanho
+
+
+# Cache único do processo: o módulo não é recarregado entre as execuções do script do Streamlit
+CACHE_DADOS = CacheLRU(ORCAMENTO_CACHE_MB * 1024 * 1024)
+
+
+def cache_limitado(ttl=3600, cache=CACHE_DADOS, revalidar=True):
+    """Decorador que guarda o retorno da função no cache com orçamento de memória.
+
+    Diferente do st.cache_data, o valor não é copiado a cada acerto: todas as sessões
+    recebem o mesmo objeto, que não deve ser modificado no lugar. Com revalidar, uma
+    entrada vencida continua sendo servida enquanto é recalculada em segundo plano,
+    e só a primeira carga de cada chave espera pelo cálculo.
+    """
+    def decorador(funcao):
+        def montar_chave(args, kwargs):
+            # O script do Streamlit redefine a função a cada execução: a chave usa o nome, não o objeto
+            return (funcao.__module__, funcao.__qualname__, args, tuple(sorted(kwargs.items())))
+
+        @wraps(funcao)
+        def envoltorio(*args, **kwargs):
+            chave = montar_chave(args, kwargs)
+            encontrado, valor, vencido = cache.obter(chave, ttl, servir_vencido=revalidar)
+            if encontrado:
+                if vencido:
+                    cache.revalidar(chave, lambda: funcao(*args, **kwargs))
+                return valor
+
+            # Sessões que pedem a mesma chave ao mesmo tempo compartilham um único cálculo
+            return cache.calcular_uma_vez(chave, lambda: funcao(*args, **kwargs))
+
+        def sem_esperar(*args, **kwargs):
+            """Retorna (pronto, valor) sem bloquear: se o valor ainda não estiver no cache,
+            o cálculo começa em segundo plano e (False, None) é retornado."""
+            chave = montar_chave(args, kwargs)
+            encontrado, valor, vencido = cache.obter(chave, ttl, servir_vencido=revalidar, contar=False)
+            if encontrado and vencido:
+                cache.revalidar(chave, lambda: funcao(*args, **kwargs))
+            elif not encontrado:
+                cache.calcular_em_segundo_plano(chave, lambda: funcao(*args, **kwargs))
+            return encontrado, valor
+
+        def atualizar(*args, **kwargs):
+            """Recalcula a entrada em segundo plano (ex.: a fonte mudou antes do ttl); o valor
+            atual continua sendo servido até o novo ficar pronto."""
+            cache.revalidar(montar_chave(args, kwargs), lambda: funcao(*args, **kwargs))
+
+        envoltorio.sem_esperar = sem_esperar
+        envoltorio.atualizar = atualizar
+        return envoltorio
+
+    return decorador
@@ -0,0 +1,88 @@
+"""Compila os dados brutos da CCEE (JSON, CSV ou Parquet) na base colunar usada pelo app.
+
+Uso:
+    python ingestao_ccee.py dados_brutos/*.csv dados_brutos/*.json.gz
+
+Toda a conversão que antes era feita a cada carregamento (datas, CNPJ, tipos numéricos
+e categorias) é aplicada uma única vez aqui; as categorias seguem os dicionários globais
+(dicionarios_ccee.json), criados aqui e depois só acrescidos. A saída é uma base particionada
+por ano (dados_ccee/ANO=AAAA/dados.parquet), ordenada por empresa e mês e comprimida com zstd.
+Somente os anos presentes nas entradas são regravados.
+"""
+import argparse
+import gzip
+import json
+import os
+import time
+
+import pandas as pd
+
+from base_ccee import (
+    ARQUIVO_DICIONARIOS, COLUNAS_CATEGORICAS, PASTA_BASE, abrir_base, atualizar_catalogo, escrever_base,
+    estender_dicionarios, normalizar_dados
+)
+
+
+def ler_json(caminho):
+    """Lê JSON-lines (formato antigo *_split.json), lista de registros ou resposta da API CKAN."""
+    abrir = gzip.open if caminho.endswith(".gz") else open
+    with abrir(caminho, "rt", encoding="utf-8") as f:
+        texto = f.read()
+
+    try:
+        conteudo = json.loads(texto)
+    except json.JSONDecodeError:
+        # Um registro por linha
+        return pd.DataFrame([json.loads(linha) for linha in texto.splitlines() if linha.strip()])
+
+    if isinstance(conteudo, dict):
+        conteudo = conteudo.get("result", {}).get("records", [])
+    return pd.DataFrame(conteudo)
+
+
+def ler_entrada(caminho, separador=";"):
+    """Lê um arquivo bruto mantendo CNPJs e códigos como texto."""
+    nome = caminho.lower()
+    if nome.endswith(".parquet"):
+        return pd.read_parquet(caminho, engine="pyarrow")
+    if nome.endswith((".csv", ".csv.gz")):
+        return pd.read_csv(caminho, sep=separador, dtype={"CNPJ_CARGA": str, "MES_REFERENCIA": str}, low_memory=False)
+    if nome.endswith((".json", ".json.gz", ".jsonl", ".jsonl.gz")):
+        return ler_json(caminho)
+    raise ValueError(f"Formato não suportado: {caminho}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compila os dados da CCEE na base colunar do app.")
+    parser.add_argument("entradas", nargs="+", help="Arquivos brutos (JSON, JSON-lines, CSV ou Parquet; aceita .gz)")
+    parser.add_argument("--saida", default=PASTA_BASE, help=f"Pasta da base particionada (padrão: {PASTA_BASE})")
+    parser.add_argument("--separador", default=";", help="Separador dos arquivos CSV (padrão: ';')")
+    parser.add_argument("--linhas-por-grupo", type=int, default=50_000, help="Linhas por row group do Parquet")
+    parser.add_argument("--nivel-compressao", type=int, default=9, help="Nível de compressão zstd")
+    args = parser.parse_args()
+
+    inicio = time.time()
+    dfs = []
+    for caminho in args.entradas:
+        df = normalizar_dados(ler_entrada(caminho, args.separador))
+        print(f"{caminho}: {len(df)} registros")
+        dfs.append(df)
+
+    # Categorias diferentes entre as entradas viram texto no concat; recriá-las uma única vez para toda a base
+    df_total = pd.concat(dfs, ignore_index=True).drop_duplicates()
+    df_total = normalizar_dados(df_total)
+
+    arquivos = escrever_base(df_total, args.saida, args.linhas_por_grupo, args.nivel_compressao)
+    for arquivo in arquivos:
+        print(f"Gravado {arquivo} ({os.path.getsize(arquivo) / (1024 * 1024):.1f} MB)")
+
+    # Catálogo de empresas já pronto para o primeiro acesso ao app (todas as partições, não só as regravadas)
+    atualizar_catalogo(abrir_base(args.saida).files)
+    # Dicionários globais: os valores novos da base entram no fim, os já gravados mantêm seus códigos
+    estender_dicionarios({col: df_total[col] for col in COLUNAS_CATEGORICAS if col in df_total.columns}, persistir=True)
+    print(f"Dicionários das colunas categóricas em {ARQUIVO_DICIONARIOS}")
+    print(f"Concluído em {time.time() - inicio:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,27 @@
 import pandas as pd
-#import numpy as np
+import numpy as np
 import streamlit as st
 import plotly.graph_objects as go
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 import requests
-import time
-from calendar import monthrange
 #import re
 #import psutil  # Para monitorar o uso de memória
 import gc  # Garbage collector
 import os
+import threading
+import time
+from api_ccee import (
+    arquivos_snapshot, buscar_registros, iniciar_sincronizacao_inicial, meses_no_periodo,
+    montar_consulta, obter_campos, pasta_snapshot, requisitar, sincronizar_snapshot
+)
+from base_ccee import (
+    ARQUIVO_TABELA, abrir_base, abrir_tabela_compartilhada, atualizar_catalogo, calcular_consumo_mwm, concatenar_dados,
+    converter_colunas_numericas, converter_mes_referencia, fatiar_tabela, impressao_digital, indexar_empresas,
+    optimize_dtypes, resumir_catalogo, selecionar_colunas_analise
+)
+from cache_ccee import CACHE_DADOS, cache_limitado
 
 # Configuração da página
 st.set_page_config(
@@ -32,24 +45,19 @@ st.markdown("<br>",unsafe_allow_html=True)  # Espaço em branco
 #st.sidebar.slider("Ajuste o uso de memória", min_value=1, max_value=100, value=30, step=1)
 #st.sidebar.write("Ajuste o uso de memória para otimizar o desempenho do aplicativo.")
 
-# ------- OTIMIZAÇÕES DE MEMÓRIA -------
+# Ocupação do cache de dados, compartilhado por todas as sessões (orçamento definido por CCEE_CACHE_MB)
+estatisticas_cache = CACHE_DADOS.estatisticas()
+st.sidebar.metric(
+    "Cache de dados",
+    f"{estatisticas_cache['bytes_usados'] / (1024 * 1024):.1f} / {estatisticas_cache['orcamento_bytes'] / (1024 * 1024):.0f} MB"
+)
+st.sidebar.caption(
+    f"{estatisticas_cache['entradas']} consultas em cache · {estatisticas_cache['acertos']} acertos · "
+    f"{estatisticas_cache['faltas']} faltas · {estatisticas_cache['remocoes']} remoções · "
+    f"{estatisticas_cache['revalidacoes']} revalidações · {estatisticas_cache['coalescidas']} consultas coalescidas"
+)
 
-# Função para otimizar tipos de dados em um DataFrame
-def optimize_dtypes(df):
-    """Otimiza os tipos de dados para reduzir o uso de memória."""
-    if df.empty:
-        return df
-    
-    # Modificar in-place em vez de criar uma cópia
-    for col in df.columns:
-        if col in ['NOME_EMPRESARIAL', 'CIDADE', 'ESTADO_UF', 'SUBMERCADO', 'SIGLA_PARCELA_CARGA']:
-            df[col] = df[col].astype('category')
-        elif df[col].dtype == 'float64':
-            df[col] = pd.to_numeric(df[col], downcast='float')
-        elif df[col].dtype == 'int64':
-            df[col] = pd.to_numeric(df[col], downcast='integer')
-    
-    return df
+# ------- OTIMIZAÇÕES DE MEMÓRIA -------
 
 # Função para liberar memória
 def clear_memory():
@@ -62,100 +70,111 @@ def clear_memory():
 resource_id_2025 = "c88d04a6-fe42-413b-b7bf-86e390494fb0"
 base_url_2025 = f"https://dadosabertos.ccee.org.br/api/3/action/datastore_search?resource_id={resource_id_2025}"
 
-# Função para carregar apenas nomes das empresas
-@st.cache_data(show_spinner=False, ttl=3600)  # Cache expira após 1 hora
+# Função para carregar o catálogo de empresas (nomes, raízes de CNPJ, anos e registros)
+@cache_limitado(ttl=3600)  # Cache expira após 1 hora
 def carregar_nomes_empresas():
-    """Carrega apenas os nomes das empresas de todos os arquivos."""
-    empresas = set()
+    """Carrega o catálogo consolidado de empresas (uma linha por empresa, em ordem alfabética)
+    a partir do catálogo persistido e da API.
     
-    # Carregar nomes das empresas de cada arquivo Parquet
-    arquivos = [
-        "base_de_dados_nacional_2022.parquet",
-        "base_de_dados_nacional_2023.parquet", 
-        "base_de_dados_nacional_2024.parquet"
-    ]
+    Retorna (catalogo, avisos): a função roda em segundo plano e o cache não repete elementos
+    do Streamlit, então os avisos são guardados com o valor e exibidos pelo script.
+    """
+    catalogo = resumir_catalogo(pd.DataFrame())
+    avisos = []
     
-    for arquivo in arquivos:
-        try:
-            if os.path.exists(arquivo):
-                # Ler todo o arquivo de uma vez para obter apenas as empresas
-                df_empresas = pd.read_parquet(arquivo, engine="pyarrow")
-                
-                if "NOME_EMPRESARIAL" in df_empresas.columns:
-                    empresas.update(df_empresas["NOME_EMPRESARIAL"].unique())
-                
-                # Liberar memória
-                del df_empresas
-                clear_memory()
-            else:
-                st.warning(f"Arquivo {arquivo} não encontrado.")
-        except Exception as e:
-            st.warning(f"Erro ao carregar empresas do arquivo {arquivo}: {e}")
+    # Catálogo persistido: só os arquivos novos ou alterados da base são relidos
+    try:
+        base = abrir_base()
+        if base is None:
+            avisos.append("Base de dados local não encontrada.")
+        snapshot_api = arquivos_snapshot(base_url_2025)
+        catalogo = resumir_catalogo(atualizar_catalogo((base.files if base is not None else []) + snapshot_api))
+    except Exception as e:
+        snapshot_api = []
+        avisos.append(f"Erro ao carregar o catálogo de empresas: {e}")
+    
+    # Snapshot da API já catalogado; sem ele, carregar nomes distintos das empresas da API de 2025
+    if snapshot_api:
+        return catalogo, avisos
     
-    # Carregar nomes das empresas da API de 2025
     try:
-        response = requests.get(f"{base_url_2025}&limit=1000", timeout=30)
-        if response.status_code == 200:
-            data = response.json()
-            records = data.get("result", {}).get("records", [])
-            if records and "NOME_EMPRESARIAL" in records[0]:
-                empresas_api = {r["NOME_EMPRESARIAL"] for r in records if "NOME_EMPRESARIAL" in r}
-                empresas.update(empresas_api)
+        # Todas as páginas de nomes distintos (mais de 1000 empresas não cabem em uma página)
+        records = buscar_registros(montar_consulta(base_url_2025, campos=["NOME_EMPRESARIAL"], distinct="true"))
+        empresas_api = {r["NOME_EMPRESARIAL"] for r in records if "NOME_EMPRESARIAL" in r}
+        
+        # Empresas vistas só na API: sem raízes de CNPJ, anos ou registros no catálogo
+        novas = sorted(empresas_api - set(catalogo["NOME_EMPRESARIAL"]))
+        if novas:
+            df_novas = pd.DataFrame({"NOME_EMPRESARIAL": novas, "RAIZES_CNPJ": "", "ANOS": [[] for _ in novas], "REGISTROS": 0})
+            catalogo = df_novas if catalogo.empty else pd.concat([catalogo, df_novas], ignore_index=True).sort_values("NOME_EMPRESARIAL", ignore_index=True)
     except Exception as e:
-        st.warning(f"Erro ao carregar empresas da API: {e}")
+        avisos.append(f"Erro ao carregar empresas da API: {e}")
     
-    return sorted(list(empresas))
+    return catalogo, avisos
 
 
-@st.cache_data(show_spinner=False, ttl=3600)  # Cache expira após 1 hora
+def ler_metadados_parquet(arquivo):
+    """Lê total de registros e período de MES_REFERENCIA a partir do rodapé do arquivo Parquet."""
+    arquivo_parquet = pq.ParquetFile(arquivo)
+    metadados = arquivo_parquet.metadata
+    schema = arquivo_parquet.schema_arrow
+    
+    if "MES_REFERENCIA" not in schema.names:
+        return metadados.num_rows, None, None
+    
+    # Com a data gravada como tipo temporal, as estatísticas dos row groups já trazem mínimo e máximo
+    idx_coluna = schema.get_field_index("MES_REFERENCIA")
+    estatisticas = [metadados.row_group(i).column(idx_coluna).statistics for i in range(metadados.num_row_groups)]
+    if pa.types.is_temporal(schema.field("MES_REFERENCIA").type) and all(e is not None and e.has_min_max for e in estatisticas):
+        min_date = min(pd.Timestamp(e.min) for e in estatisticas) if estatisticas else pd.NaT
+        max_date = max(pd.Timestamp(e.max) for e in estatisticas) if estatisticas else pd.NaT
+        return metadados.num_rows, min_date, max_date
+    
+    # Data gravada como texto: decodificar apenas a coluna de datas e converter somente os valores distintos
+    coluna = pq.read_table(arquivo, columns=["MES_REFERENCIA"], read_dictionary=["MES_REFERENCIA"]).column(0)
+    datas = converter_mes_referencia(pd.Series(pc.unique(coluna).to_pylist(), dtype="object"))
+    return metadados.num_rows, datas.min(), datas.max()
+
+@cache_limitado(ttl=3600)  # Cache expira após 1 hora
 def obter_informacoes_base():
-    """Obtém informações básicas da base de dados sem carregar todos os registros."""
+    """Obtém informações básicas da base de dados sem carregar todos os registros (com os avisos em info["avisos"])."""
     info = {
         "data_mais_antiga": None,
         "data_mais_recente": None,
-        "total_registros": 0
+        "total_registros": 0,
+        "avisos": []
     }
     
-    # Lista de arquivos a verificar
-    arquivos = [
-        "base_de_dados_nacional_2022.parquet",
-        "base_de_dados_nacional_2023.parquet", 
-        "base_de_dados_nacional_2024.parquet"
-    ]
-    
-    # Verificar cada arquivo
-    for arquivo in arquivos:
+    # Verificar cada arquivo da base local e do snapshot da API
+    base = abrir_base()
+    snapshot_api = arquivos_snapshot(base_url_2025)
+    for arquivo in (base.files if base is not None else []) + snapshot_api:
         if os.path.exists(arquivo):
             try:
-                # Carregar apenas as primeiras linhas para verificar estrutura
-                df_amostra = pd.read_parquet(arquivo, engine="pyarrow")
+                # Ler apenas os metadados do rodapé do arquivo
+                total, min_date, max_date = ler_metadados_parquet(arquivo)
                 
                 # Contar registros
-                info["total_registros"] += len(df_amostra)
+                info["total_registros"] += total
                 
                 # Verificar datas
-                if "MES_REFERENCIA" in df_amostra.columns:
-                    df_amostra["MES_REFERENCIA"] = pd.to_datetime(df_amostra["MES_REFERENCIA"], errors="coerce", dayfirst=True)
-                    
-                    min_date = df_amostra["MES_REFERENCIA"].min()
-                    max_date = df_amostra["MES_REFERENCIA"].max()
-                    
-                    if info["data_mais_antiga"] is None or (min_date is not pd.NaT and min_date < info["data_mais_antiga"]):
+                if min_date is not None and not pd.isna(min_date):
+                    if info["data_mais_antiga"] is None or min_date < info["data_mais_antiga"]:
                         info["data_mais_antiga"] = min_date
-                    
-                    if info["data_mais_recente"] is None or (max_date is not pd.NaT and max_date > info["data_mais_recente"]):
-                        info["data_mais_recente"] = max_date
                 
-                # Liberar memória
-                del df_amostra
-                clear_memory()
+                if max_date is not None and not pd.isna(max_date):
+                    if info["data_mais_recente"] is None or max_date > info["data_mais_recente"]:
+                        info["data_mais_recente"] = max_date
             
             except Exception as e:
-                st.warning(f"Erro ao obter informações do arquivo {arquivo}: {e}")
+                info["avisos"].append(f"Erro ao obter informações do arquivo {arquivo}: {e}")
     
-    # Verificar API de 2025
+    if snapshot_api:
+        return info
+    
+    # Verificar API de 2025 (uma única consulta traz o total e o registro mais recente)
     try:
-        response = requests.get(f"{base_url_2025}&limit=10", timeout=30)
+        response = requisitar(f"{base_url_2025}&limit=1&sort=MES_REFERENCIA desc", timeout=30)
         if response.status_code == 200:
             data = response.json()
             
@@ -163,134 +182,226 @@ def obter_informacoes_base():
             total_api = data.get("result", {}).get("total", 0)
             info["total_registros"] += total_api
             
-            # Obter registros para verificar datas
+            # Obter data mais recente
             records = data.get("result", {}).get("records", [])
             if records and "MES_REFERENCIA" in records[0]:
-                # Fazer uma consulta adicional para obter a data mais recente
                 try:
-                    response_recente = requests.get(f"{base_url_2025}&limit=1&sort=MES_REFERENCIA desc", timeout=30)
-                    data_recente = response_recente.json()
-                    records_recente = data_recente.get("result", {}).get("records", [])
+                    data_api = converter_mes_referencia(pd.Series([records[0]["MES_REFERENCIA"]])).iloc[0]
                     
-                    if records_recente and "MES_REFERENCIA" in records_recente[0]:
-                        data_str = records_recente[0]["MES_REFERENCIA"]
-                        data_formatada = f"01/{data_str[4:6]}/{data_str[:4]}"
-                        data_api = pd.to_datetime(data_formatada, dayfirst=True)
-                        
-                        if info["data_mais_recente"] is None or data_api > info["data_mais_recente"]:
-                            info["data_mais_recente"] = data_api
+                    if not pd.isna(data_api) and (info["data_mais_recente"] is None or data_api > info["data_mais_recente"]):
+                        info["data_mais_recente"] = data_api
                 except:
                     pass
     except Exception as e:
-        st.warning(f"Erro ao obter informações da API: {e}")
+        info["avisos"].append(f"Erro ao obter informações da API: {e}")
     
     return info
 
-@st.cache_data(show_spinner=False, ttl=3600)  # Cache expira após 1 hora
-def carregar_dados_api(url, ano, empresa=None, data_inicio=None, data_fim=None, max_requests=50):
-    """Carrega dados da API com filtros aplicados."""
-    all_records = []
+@cache_limitado(ttl=3600)  # Cache expira após 1 hora
+def sincronizar_api(url):
+    """Sincroniza o snapshot local do recurso com a API, no máximo uma vez por hora.
+    
+    Retorna os meses atualizados. Erros da API são propagados, e não guardados no cache:
+    a próxima execução tenta de novo e, na revalidação, o resultado anterior é mantido.
+    """
+    return sincronizar_snapshot(url)
+
+@cache_limitado(ttl=3600)  # Cache expira após 1 hora
+def carregar_dados_api(url, ano, empresas=None):
+    """Carrega da API o histórico completo do ano, com filtros exatos aplicados no servidor, para todas as empresas de uma vez.
+    
+    O período não faz parte da chave do cache: mudar as datas reaproveita o mesmo histórico,
+    recortado depois por filtrar_periodo. Erros da API são propagados, e não guardados no
+    cache: um histórico já carregado nunca é substituído por um resultado vazio.
+    """
     limit = 1000
-    offset = 0
-    request_count = 0
     
     #with st.spinner(f"Carregando dados de {ano} da API..."):
-    api_url = url
-    if empresa:
-        # Extrair parte do nome para consultar a API (evita problemas com aspas e caracteres especiais)
-        # Pegando apenas os primeiros 20 caracteres ou até o primeiro espaço como filtro aproximado
-        empresa_simples = empresa.split()[0][:20]
-        
-        # Adicionar filtro aproximado na consulta da API
-        api_url = f"{url}&q={{\"NOME_EMPRESARIAL\":\"{empresa_simples}\"}}"
-    
-    while request_count < max_requests:
-        try:
-            current_url = f"{api_url}&limit={limit}&offset={offset}"
-            #st.write(f"Consultando API: {current_url}") # Temporário para debug
-            
-            response = requests.get(current_url, timeout=30)
-            response.raise_for_status()
-            data = response.json()
-            records = data.get("result", {}).get("records", [])
-            
-            if not records:
-                break
-            
-            all_records.extend(records)
-            offset += limit
-            request_count += 1
-            
-            # Se não houver mais dados, pare
-            if len(records) < limit:
-                break
-                
-        except requests.exceptions.RequestException as e:
-            st.warning(f"Erro ao carregar dados da API: {e}")
-            time.sleep(2)
-            break
+    # Filtros exatos no servidor: apenas as empresas e os meses do ano são transferidos
+    filtros = {"MES_REFERENCIA": meses_no_periodo(ano)}
+    if empresas:
+        filtros["NOME_EMPRESARIAL"] = list(empresas)
     
-    df = pd.DataFrame(all_records)
+    # Projeção: pedir à API somente as colunas usadas na análise
+    campos = selecionar_colunas_analise(obter_campos(url))
+    api_url = montar_consulta(url, filtros, campos)
     
-    # Agora aplicamos um filtro exato no DataFrame
-    if not df.empty and empresa and "NOME_EMPRESARIAL" in df.columns:
-        # Manter apenas registros com nome exato da empresa
-        df = df[df["NOME_EMPRESARIAL"] == empresa]
-        #st.write(f"Após filtro exato por '{empresa}': {df.shape[0]} registros")
+    # Primeira página traz o total; as demais páginas são buscadas em paralelo
+    #st.write(f"Consultando API: {api_url}") # Temporário para debug
+    df = pd.DataFrame(buscar_registros(api_url, limit=limit))
     
     if not df.empty and "MES_REFERENCIA" in df.columns:
-        df["MES_REFERENCIA"] = df["MES_REFERENCIA"].astype(str)
-        df["MES_REFERENCIA"] = df["MES_REFERENCIA"].apply(lambda x: f"01/{x[4:6]}/{x[:4]}")
-        df["MES_REFERENCIA"] = pd.to_datetime(df["MES_REFERENCIA"], dayfirst=True)
-        
-        # Aplicar filtros de data
-        if data_inicio:
-            df = df[df["MES_REFERENCIA"] >= pd.to_datetime(data_inicio)]
-        if data_fim:
-            df = df[df["MES_REFERENCIA"] <= pd.to_datetime(data_fim)]
-    
-    return optimize_dtypes(df)
-
-@st.cache_data(show_spinner=False, ttl=3600)  # Cache expira após 1 hora
-def carregar_dados_parquet(nome_arquivo, empresa=None, data_inicio=None, data_fim=None):
-    """Carrega dados Parquet com filtros aplicados."""
-    if not os.path.exists(nome_arquivo):
-        st.warning(f"Arquivo {nome_arquivo} não encontrado.")
+        df["MES_REFERENCIA"] = converter_mes_referencia(df["MES_REFERENCIA"])
+    
+    # A API devolve números como texto: converter uma vez aqui, antes de guardar no cache
+    return optimize_dtypes(converter_colunas_numericas(df))
+
+def filtrar_periodo(df, data_inicio=None, data_fim=None):
+    """Recorta o período pedido de um histórico já carregado (sem nova consulta)."""
+    if df.empty or "MES_REFERENCIA" not in df.columns:
+        return df
+    
+    # Aplicar filtros de data
+    if data_inicio:
+        df = df[df["MES_REFERENCIA"] >= pd.to_datetime(data_inicio)]
+    if data_fim:
+        df = df[df["MES_REFERENCIA"] <= pd.to_datetime(data_fim)]
+    return df
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def carregar_tabela_compartilhada(fontes, caminho_tabela):
+    """Tabela Arrow única no processo, compartilhada somente leitura por todas as sessões, e seu índice de empresas.
+    
+    As impressões digitais dos arquivos fazem parte da chave: quando a base muda, uma nova tabela é aberta.
+    """
+    tabela = abrir_tabela_compartilhada([arquivo for arquivo, _ in fontes], caminho_tabela)
+    indice = indexar_empresas(tabela) if tabela is not None else {}
+    return tabela, indice
+
+def obter_tabela_compartilhada(arquivos, caminho_tabela):
+    """Tabela compartilhada e índice correspondentes à versão atual dos arquivos."""
+    fontes = tuple((os.path.normpath(arquivo), impressao_digital(arquivo)) for arquivo in arquivos)
+    return carregar_tabela_compartilhada(fontes, caminho_tabela)
+
+def ler_tabela_compartilhada(arquivos, caminho_tabela, empresas=None, data_inicio=None, data_fim=None):
+    """Recorta da tabela compartilhada as empresas e o período pedidos (fatias, sem cópia até o pandas)."""
+    tabela, indice = obter_tabela_compartilhada(arquivos, caminho_tabela)
+    if tabela is None:
+        return pd.DataFrame()
+    return fatiar_tabela(tabela, indice, empresas, data_inicio, data_fim).to_pandas(date_as_object=False)
+
+def carregar_dados_parquet(empresas=None, data_inicio=None, data_fim=None):
+    """Carrega dados da base local com filtros aplicados, para todas as empresas em uma única leitura."""
+    dataset = abrir_base()
+    if dataset is None:
+        st.warning("Base de dados local não encontrada.")
         return pd.DataFrame()
     
     try:
-        #with st.spinner(f"Carregando dados de {nome_arquivo}..."):
-        # Ler o arquivo Parquet
-        df = pd.read_parquet(nome_arquivo, engine="pyarrow")
-        
-        # Filtrar para a empresa desejada se especificada
-        if empresa and "NOME_EMPRESARIAL" in df.columns:
-            df = df[df["NOME_EMPRESARIAL"] == empresa]
-        
-        # Processar datas e aplicar filtros
-        if not df.empty and "MES_REFERENCIA" in df.columns:
-            df["MES_REFERENCIA"] = pd.to_datetime(df["MES_REFERENCIA"], errors="coerce", dayfirst=True)
-            
-            # Aplicar filtros de data
-            if data_inicio:
-                df = df[df["MES_REFERENCIA"] >= pd.to_datetime(data_inicio)]
-            if data_fim:
-                df = df[df["MES_REFERENCIA"] <= pd.to_datetime(data_fim)]
-        
-        return optimize_dtypes(df)
+        #with st.spinner("Carregando dados da base local..."):
+        return ler_tabela_compartilhada(dataset.files, ARQUIVO_TABELA, empresas, data_inicio, data_fim)
     
     except Exception as e:
-        st.error(f"Erro ao carregar {nome_arquivo}: {e}")
+        st.error(f"Erro ao carregar a base de dados local: {e}")
+        return pd.DataFrame()
+
+def carregar_dados_snapshot(url, empresas=None, data_inicio=None, data_fim=None):
+    """Carrega dados do snapshot local da API, trazendo antes os meses novos ou revisados."""
+    try:
+        sincronizar_api(url)
+    except requests.exceptions.RequestException as e:
+        st.warning(f"Erro ao sincronizar o snapshot da API, usando a última cópia local: {e}")
+    try:
+        caminho_tabela = os.path.join(pasta_snapshot(url), ARQUIVO_TABELA)
+        return ler_tabela_compartilhada(arquivos_snapshot(url), caminho_tabela, empresas, data_inicio, data_fim)
+    except Exception as e:
+        st.warning(f"Erro ao ler o snapshot local da API: {e}")
         return pd.DataFrame()
 
+# Fontes de dados: base local (todos os anos disponíveis) e API do ano corrente
+FONTES_DADOS = [
+    ("base local", None),
+    ("API", base_url_2025)
+]
+
+def carregar_dados_empresas(empresas, data_inicio=None, data_fim=None, ao_carregar_fonte=None):
+    """Carrega os dados de todas as empresas lendo cada fonte uma única vez."""
+    # Tupla ordenada: a mesma seleção em outra ordem reaproveita o cache
+    empresas = tuple(sorted(set(empresas)))
+    dfs = []
+    
+    for i, (fonte, url) in enumerate(FONTES_DADOS):
+        if ao_carregar_fonte:
+            ao_carregar_fonte(i, fonte)
+        
+        if url and arquivos_snapshot(url):
+            # Snapshot local já existe: a API serve só para trazer os meses novos ou revisados
+            dfs.append(carregar_dados_snapshot(url, empresas, data_inicio, data_fim))
+        elif url:
+            # Sem snapshot ainda: baixar o recurso em segundo plano e, enquanto isso, consultar a API ao vivo
+            iniciar_sincronizacao_inicial(url, ao_concluir=carregar_nomes_empresas.atualizar)
+            try:
+                df_api = carregar_dados_api(url, 2025, empresas)
+            except requests.exceptions.RequestException as e:
+                st.warning(f"Erro ao carregar dados da API: {e}")
+                df_api = pd.DataFrame()
+            dfs.append(filtrar_periodo(df_api, data_inicio, data_fim))
+        else:
+            dfs.append(carregar_dados_parquet(empresas, data_inicio, data_fim))
+    
+    # Uma única concatenação no final, com as categorias das fontes unificadas
+    return concatenar_dados(dfs)
+
+# ------- AQUECIMENTO DO CACHE -------
+
+# Empresas mais consultadas, pré-carregadas na inicialização (separadas por ";")
+EMPRESAS_AQUECIDAS = [empresa.strip() for empresa in os.environ.get("CCEE_EMPRESAS_AQUECIDAS", "").split(";") if empresa.strip()]
+
+def aquecer_cache():
+    """Pré-carrega catálogo, informações da base, tabelas compartilhadas, snapshot da API e empresas mais consultadas."""
+    def aquecer_base():
+        base = abrir_base()
+        if base is not None:
+            obter_tabela_compartilhada(base.files, ARQUIVO_TABELA)
+    
+    def aquecer_snapshot():
+        if arquivos_snapshot(base_url_2025):
+            sincronizar_api(base_url_2025)
+            obter_tabela_compartilhada(arquivos_snapshot(base_url_2025), os.path.join(pasta_snapshot(base_url_2025), ARQUIVO_TABELA))
+        else:
+            iniciar_sincronizacao_inicial(base_url_2025, ao_concluir=carregar_nomes_empresas.atualizar)
+    
+    etapas = [carregar_nomes_empresas, obter_informacoes_base, aquecer_base, aquecer_snapshot]
+    etapas += [lambda empresa=empresa: carregar_dados_empresas([empresa]) for empresa in EMPRESAS_AQUECIDAS]
+    
+    for etapa in etapas:
+        try:
+            etapa()
+        except Exception:
+            # Aquecimento é só uma antecipação: a sessão que precisar do dado tenta de novo
+            pass
+
+@st.cache_resource(show_spinner=False)
+def iniciar_aquecimento():
+    """Dispara o aquecimento em segundo plano uma única vez por processo, na primeira execução do app."""
+    thread = threading.Thread(target=aquecer_cache, name="aquecimento-cache", daemon=True)
+    thread.start()
+    return thread
+
+iniciar_aquecimento()
+
 # ------- INTERFACE DE USUÁRIO -------
 
-# Carregar lista de empresas
-with st.spinner("Carregando lista de empresas..."):
-    empresas_disponiveis = carregar_nomes_empresas()
+# Segundos de espera pelo catálogo antes de avisar que a CCEE está lenta
+LIMITE_ESPERA_CATALOGO = 10
+
+# Lista de empresas e informações da base: usar o que já estiver em cache e, se ainda não estiver,
+# desenhar a página enquanto o carregamento termina em segundo plano
+catalogo_pronto, catalogo = carregar_nomes_empresas.sem_esperar()
+info_pronta, info_base = obter_informacoes_base.sem_esperar()
+
+@st.fragment(run_every=1)
+def acompanhar_carregamento():
+    """Verifica a cada segundo se o catálogo e as informações da base ficaram prontos e então recarrega a página."""
+    if carregar_nomes_empresas.sem_esperar()[0] and obter_informacoes_base.sem_esperar()[0]:
+        st.session_state.pop("inicio_carregamento", None)
+        st.rerun()
+    
+    espera = time.monotonic() - st.session_state.setdefault("inicio_carregamento", time.monotonic())
+    if espera > LIMITE_ESPERA_CATALOGO:
+        st.warning("A CCEE está demorando para responder. A lista de empresas será preenchida assim que o carregamento terminar.")
+    else:
+        st.info("Carregando lista de empresas...")
+
+if not (catalogo_pronto and info_pronta):
+    acompanhar_carregamento()
+    catalogo = catalogo or (resumir_catalogo(pd.DataFrame()), [])
+    info_base = info_base or {"data_mais_antiga": None, "data_mais_recente": None, "total_registros": 0, "avisos": []}
 
-# Obter informações básicas da base
-info_base = obter_informacoes_base()
+# Avisos do carregamento, guardados junto com os valores em cache
+catalogo_empresas, avisos_catalogo = catalogo
+for aviso in avisos_catalogo + info_base["avisos"]:
+    st.warning(aviso)
 
 # Mostrar informações básicas
 if info_base["data_mais_antiga"] is not None and info_base["data_mais_recente"] is not None:
@@ -300,10 +411,19 @@ if info_base["data_mais_antiga"] is not None and info_base["data_mais_recente"]
 
 #if info_base["total_registros"] > 0:
 #    st.write(f"Base completa tem {info_base['total_registros']} registros.")
+# Raízes de CNPJ no rótulo: a busca do multiselect também encontra a empresa pelo CNPJ
+raizes_cnpj = dict(zip(catalogo_empresas["NOME_EMPRESARIAL"], catalogo_empresas["RAIZES_CNPJ"]))
+
+def rotulo_empresa(empresa):
+    """Nome da empresa seguido das raízes de CNPJ conhecidas no catálogo."""
+    raizes = raizes_cnpj.get(empresa)
+    return f"{empresa} (CNPJ {', '.join(raizes.split(';'))})" if raizes else empresa
+
 # Inputs
 empresas_selecionadas = st.multiselect(
     "Selecione as empresas desejadas",
-    options=empresas_disponiveis,
+    options=catalogo_empresas["NOME_EMPRESARIAL"].tolist(),
+    format_func=rotulo_empresa,
     default=None,
     placeholder="Selecione as empresas desejadas",
     help="Selecione uma ou mais empresas para análise. Se nenhuma empresa for selecionada, todos os dados serão carregados."
@@ -325,62 +445,16 @@ st.markdown("<br/>", unsafe_allow_html=True)  # Espaço em branco
 
 if st.button(":red[Gerar Gráfico]") and empresas_selecionadas:
     # Agora carregamos dados apenas para as empresas selecionadas
-    df_total_filtrado = pd.DataFrame()
-    
-    # Função para processar cada arquivo e empresa
-    def processar_arquivo(arquivo, ano, empresa, data_inicio, data_fim):
-        if arquivo.startswith("http"):
-            return carregar_dados_api(arquivo, ano, empresa, data_inicio, data_fim)
-        else:
-            return carregar_dados_parquet(arquivo, empresa, data_inicio, data_fim)
-    
-    # Processar cada empresa selecionada
     progress_text = st.empty()
     progress_bar = st.progress(0)
     
-    for i, empresa in enumerate(empresas_selecionadas):
-        progress_text.text(f"Processando dados para: {empresa}")
-        progress_bar.progress(i / len(empresas_selecionadas))
-        
-        # Carregar dados de cada fonte
-        df_2022 = processar_arquivo("base_de_dados_nacional_2022.parquet", 2022, empresa, data_inicio, data_fim)
-        df_2023 = processar_arquivo("base_de_dados_nacional_2023.parquet", 2023, empresa, data_inicio, data_fim)
-        df_2024 = processar_arquivo("base_de_dados_nacional_2024.parquet", 2024, empresa, data_inicio, data_fim)
-        df_2025 = processar_arquivo(base_url_2025, 2025, empresa, data_inicio, data_fim)
-         
-        
-        # Diagnóstico dos dados da API
-        #with st.sidebar.expander("Diagnóstico dos dados da API", icon="🔍"):
-        #   st.write(f"Shape dos dados da API: {df_2025.shape}")
-            
-        #   if not df_2025.empty:
-        #       st.write(f"Colunas disponíveis na API: {df_2025.columns.tolist()}")
-        #       st.write(f"Amostra dos dados da API:")
-        #       st.dataframe(df_2025.head(df_2025.shape[0]))
-                
-        #       if "MES_REFERENCIA" in df_2025.columns:
-        #           st.write(f"Período dos dados: {df_2025['MES_REFERENCIA'].min()} a {df_2025['MES_REFERENCIA'].max()}")
-                  
-                # Verificar coluna de consumo
-        #       consumo_cols = [col for col in df_2025.columns if "CONSUMO" in col.upper()]
-        #       if consumo_cols:
-        #           st.write(f"Colunas de consumo encontradas: {consumo_cols}")
-        #           for col in consumo_cols:
-        #               st.write(f"Valor médio de {col}: {df_2025[col].mean()}")
-        #       else:
-        #           st.warning("Nenhuma coluna de consumo encontrada nos dados da API")
-        #   else:
-        #       st.warning("Nenhum dado retornado da API")
-
-        # Combinar dados da empresa
-        df_empresa = pd.concat([df_2022, df_2023, df_2024, df_2025], ignore_index=True)
-        
-        # Adicionar ao DataFrame total
-        df_total_filtrado = pd.concat([df_total_filtrado, df_empresa], ignore_index=True)
-        
-        # Liberar memória
-        del df_2022, df_2023, df_2024, df_2025, df_empresa
-        clear_memory()
+    def atualizar_progresso(i, fonte):
+        progress_text.text(f"Processando dados da {fonte} para {len(empresas_selecionadas)} empresa(s)")
+        progress_bar.progress(i / len(FONTES_DADOS))
+    
+    # Carregar dados de todas as fontes com uma leitura por fonte
+    df_total_filtrado = carregar_dados_empresas(empresas_selecionadas, data_inicio, data_fim, atualizar_progresso)
+    clear_memory()
 
     progress_bar.progress(1.0)
     progress_text.text("Processamento concluído!")
@@ -398,13 +472,7 @@ if st.button(":red[Gerar Gráfico]") and empresas_selecionadas:
         df_total_ord = df_total_ord.drop(columns=["id"])
     
     # Calcular horas no mês e consumo em MWm
-    df_total_ord["HORAS_NO_MES"] = df_total_ord["MES_REFERENCIA"].apply(
-        lambda x: monthrange(x.year, x.month)[1] * 24
-    )
-    
-    col_consumo = next((col for col in df_total_ord.columns if "CONSUMO" in col.upper() and "TOTAL" in col.upper()), None)
-    if col_consumo:
-        df_total_ord["CONSUMO_MWm"] = pd.to_numeric(df_total_ord[col_consumo], errors="coerce") / df_total_ord["HORAS_NO_MES"]
+    df_total_ord = calcular_consumo_mwm(df_total_ord)
     
     # Análise mensal - modificado para separar por empresa e manter indicação de flexibilização
     df_total_ord["Ano_Mes"] = df_total_ord["MES_REFERENCIA"].dt.to_period("M")
@@ -485,32 +553,27 @@ if st.button(":red[Gerar Gráfico]") and empresas_selecionadas:
     # Pivot para ordenar corretamente os dados
     pivot_meses = sorted(df_mensal_empresa["Ano_Mes"].unique())
     
+    # Matrizes empresas × meses (zero onde a empresa não tem consumo no mês) e máscara paralela de flexibilização
+    matriz_consumo = df_mensal_empresa.pivot(index="NOME_EMPRESARIAL", columns="Ano_Mes", values="CONSUMO_MWm")
+    matriz_consumo = matriz_consumo.reindex(index=empresas_unicas, columns=pivot_meses)
+    # Meses sem dado ficam fora da faixa = False já no unstack, sem passar por NaN (e pelo fillna em object)
+    matriz_fora_faixa = df_mensal_empresa.set_index(["NOME_EMPRESARIAL", "Ano_Mes"])["fora_faixa"].unstack(fill_value=False)
+    matriz_fora_faixa = matriz_fora_faixa.reindex(index=empresas_unicas, columns=pivot_meses, fill_value=False).to_numpy(dtype=bool)
+    
+    # Definir cor de preenchimento baseada na flexibilização (meses sem consumo ficam em azul transparente)
+    matriz_cores = np.where(
+        matriz_consumo.notna().to_numpy(),
+        np.where(matriz_fora_faixa, "rgba(220, 20, 60, 1)", "rgba(65, 105, 225, 1)"),  # Crimson / RoyalBlue
+        "rgba(65, 105, 225, 0.7)"  # RoyalBlue com transparência
+    )
+    matriz_consumo = matriz_consumo.fillna(0).to_numpy()
+    
     # Adicionar barras para cada empresa, mantendo a indicação de flexibilização
     for i, empresa in enumerate(empresas_unicas):
-        df_empresa = df_mensal_empresa[df_mensal_empresa["NOME_EMPRESARIAL"] == empresa]
-        
-        # Preparar dados para esse trace
-        dados_x = []
-        dados_y = []
-        cores_barras = []
-        
-        # Garantir que todos os meses estejam representados (preenchendo com zeros onde necessário)
-        for mes in pivot_meses:
-            row = df_empresa[df_empresa["Ano_Mes"] == mes]
-            
-            if len(row) > 0:
-                dados_x.append(mes)
-                dados_y.append(row["CONSUMO_MWm"].values[0])
-                
-                # Definir cor de preenchimento baseada na flexibilização
-                if row["fora_faixa"].values[0]:
-                    cores_barras.append("rgba(220, 20, 60, 1)")  # Crimson com transparência
-                else:
-                    cores_barras.append("rgba(65, 105, 225, 1)")  # RoyalBlue com transparência
-            else:
-                dados_x.append(mes)
-                dados_y.append(0)
-                cores_barras.append("rgba(65, 105, 225, 0.7)")  # RoyalBlue com transparência
+        # Todos os meses representados, na ordem de pivot_meses
+        dados_x = pivot_meses
+        dados_y = matriz_consumo[i].tolist()
+        cores_barras = matriz_cores[i].tolist()
         
         # Configurações específicas baseadas no número de empresas
         if multiplas_empresas:
@@ -776,69 +839,63 @@ if st.button(":red[Gerar Gráfico]") and empresas_selecionadas:
     df_ultimos_12_meses = df_total_ord[df_total_ord["MES_REFERENCIA"] >= data_limite].copy()
     
     if not df_ultimos_12_meses.empty:
-        # Usar vectorized operations em vez de apply para formatar CNPJs
+        # Formatar CNPJs uma única vez por valor distinto (cada CNPJ se repete em todos os meses)
         if "CNPJ_CARGA" in df_ultimos_12_meses.columns:
-            mask = ~df_ultimos_12_meses["CNPJ_CARGA"].isna()
-            df_ultimos_12_meses.loc[mask, "CNPJ_CARGA"] = (
-                df_ultimos_12_meses.loc[mask, "CNPJ_CARGA"]
+            codigos_cnpj, cnpjs_distintos = pd.factorize(df_ultimos_12_meses["CNPJ_CARGA"])
+            cnpjs_formatados = (
+                pd.Series(cnpjs_distintos, dtype=object)
                 #.astype(float).astype(int).astype(str).str.zfill(14) conversão desnecessária porque foi aplicado as bases de dados
                 .str.replace(r'(\d{2})(\d{3})(\d{3})(\d{4})(\d{2})', r'\1.\2.\3/\4-\5', regex=True)
+                .to_numpy()
             )
+            mask = codigos_cnpj >= 0
+            df_ultimos_12_meses.loc[mask, "CNPJ_CARGA"] = cnpjs_formatados[codigos_cnpj[mask]]
 
         
-        # Resumo de empresas
-        resumo_dados = []
+        # Resumo de empresas: uma única passada agrupada sobre todas as empresas selecionadas
+        df_empresas_12m = df_ultimos_12_meses[df_ultimos_12_meses["NOME_EMPRESARIAL"].isin(empresas_selecionadas)].reset_index(drop=True)
+        df_empresas_12m["NOME_EMPRESARIAL"] = df_empresas_12m["NOME_EMPRESARIAL"].astype(str)
+        grupos_empresa = df_empresas_12m.groupby("NOME_EMPRESARIAL", sort=False)
         
-        for empresa in empresas_selecionadas:
-            df_emp_12m = df_ultimos_12_meses[df_ultimos_12_meses["NOME_EMPRESARIAL"] == empresa].copy()
+        # Empresas com dados no período, na ordem em que foram selecionadas
+        empresas_resumo = [empresa for empresa in empresas_selecionadas if empresa in grupos_empresa.groups]
+        resumo_df = pd.DataFrame({"Empresa": empresas_resumo})
+        
+        if "SIGLA_PARCELA_CARGA" in df_empresas_12m.columns:
+            resumo_df["Unidades"] = grupos_empresa["SIGLA_PARCELA_CARGA"].nunique().reindex(empresas_resumo).to_numpy()
+        else:
+            resumo_df["Unidades"] = "N/D"
+        
+        if "SUBMERCADO" in df_empresas_12m.columns:
+            resumo_df["Submercado Misto"] = np.where(grupos_empresa["SUBMERCADO"].nunique().reindex(empresas_resumo) > 1, "Sim", "Não")
+        else:
+            resumo_df["Submercado Misto"] = "N/D"
+        
+        # Determinar centro decisório se tivermos CNPJ_CARGA: a primeira unidade com CNPJ de matriz (0001)
+        # ou, se a empresa não tiver matriz, a primeira unidade do CNPJ com maior consumo médio
+        colunas_centro = ["CIDADE", "ESTADO_UF", "CNPJ_CARGA"]
+        centros = pd.DataFrame(columns=colunas_centro)
+        if "CNPJ_CARGA" in df_empresas_12m.columns:
+            linhas_centro = df_empresas_12m[["NOME_EMPRESARIAL"] + colunas_centro].astype(object)
+            eh_matriz = df_empresas_12m["CNPJ_CARGA"].astype(object).str[11:15] == "0001"
+            centros_matriz = linhas_centro[eh_matriz].drop_duplicates("NOME_EMPRESARIAL").set_index("NOME_EMPRESARIAL")
             
-            if not df_emp_12m.empty:
-                if "SIGLA_PARCELA_CARGA" in df_emp_12m.columns:
-                    unidades = df_emp_12m["SIGLA_PARCELA_CARGA"].nunique()
-                else:
-                    unidades = "N/D"
-                    
-                if "SUBMERCADO" in df_emp_12m.columns:
-                    sub_misto = "Sim" if df_emp_12m["SUBMERCADO"].nunique() > 1 else "Não"
-                else:
-                    sub_misto = "N/D"
-                
-                # Determinar centro decisório se tivermos CNPJ_CARGA
-                if "CNPJ_CARGA" in df_emp_12m.columns:
-                    df_emp_12m["MATRIZ"] = df_emp_12m["CNPJ_CARGA"].str[11:15] == "0001"
-                    
-                    if "CONSUMO_MWm" in df_emp_12m.columns:
-                        consumo_por_cnpj = df_emp_12m.groupby("CNPJ_CARGA", observed=True)["CONSUMO_MWm"].mean().reset_index()
-                        df_emp_12m = df_emp_12m.merge(consumo_por_cnpj, on="CNPJ_CARGA", suffixes=("", "_MEDIO"))
-                    
-                    if "MATRIZ" in df_emp_12m.columns and df_emp_12m["MATRIZ"].any():
-                        filtro_matriz = df_emp_12m[df_emp_12m["MATRIZ"]]
-                        if not filtro_matriz.empty:
-                            centro = filtro_matriz[["CIDADE", "ESTADO_UF", "CNPJ_CARGA"]].iloc[0]
-                        else:
-                            centro = {"CIDADE": "N/D", "ESTADO_UF": "N/D", "CNPJ_CARGA": ""}
-                    else:
-                        try:
-                            if "CONSUMO_MWm_MEDIO" in df_emp_12m.columns:
-                                idx_maior_consumo = df_emp_12m["CONSUMO_MWm_MEDIO"].idxmax()
-                                centro = df_emp_12m.loc[idx_maior_consumo, ["CIDADE", "ESTADO_UF", "CNPJ_CARGA"]]
-                            else:
-                                centro = {"CIDADE": "N/D", "ESTADO_UF": "N/D", "CNPJ_CARGA": ""}
-                        except:
-                            centro = {"CIDADE": "N/D", "ESTADO_UF": "N/D", "CNPJ_CARGA": ""}
-                else:
-                    centro = {"CIDADE": "N/D", "ESTADO_UF": "N/D", "CNPJ_CARGA": ""}
-                
-                resumo_dados.append({
-                    "Empresa": empresa,
-                    "Unidades": unidades,
-                    "Submercado Misto": sub_misto,
-                    "Possível Centro Decisório": f"{centro['CIDADE']} / {centro['ESTADO_UF']}",
-                    "CNPJ do Centro Decisório": centro["CNPJ_CARGA"]
-                })
+            centros_consumo = pd.DataFrame(columns=colunas_centro)
+            if "CONSUMO_MWm" in df_empresas_12m.columns:
+                consumo_medio_cnpj = df_empresas_12m.groupby(["NOME_EMPRESARIAL", "CNPJ_CARGA"], observed=True)["CONSUMO_MWm"].transform("mean")
+                consumo_medio_cnpj = consumo_medio_cnpj.dropna()
+                idx_maior_consumo = consumo_medio_cnpj.groupby(df_empresas_12m.loc[consumo_medio_cnpj.index, "NOME_EMPRESARIAL"]).idxmax()
+                centros_consumo = linhas_centro.loc[idx_maior_consumo.to_numpy()].set_index("NOME_EMPRESARIAL")
+            
+            centros = pd.concat([centros_matriz, centros_consumo[~centros_consumo.index.isin(centros_matriz.index)]])
+        
+        centros = centros.reindex(empresas_resumo)
+        sem_centro = centros["CNPJ_CARGA"].isna()
+        centros.loc[sem_centro, colunas_centro] = ["N/D", "N/D", ""]
+        resumo_df["Possível Centro Decisório"] = (centros["CIDADE"].astype(str) + " / " + centros["ESTADO_UF"].astype(str)).to_numpy()
+        resumo_df["CNPJ do Centro Decisório"] = centros["CNPJ_CARGA"].to_numpy()
         
-        if resumo_dados:
-            resumo_df = pd.DataFrame(resumo_dados)
+        if not resumo_df.empty:
             st.write("### 📋 Resumo da(s) Empresa(s)")
             st.dataframe(resumo_df, hide_index=True)
         
@@ -867,46 +924,31 @@ if st.button(":red[Gerar Gráfico]") and empresas_selecionadas:
             st.write("### 🌎 Percentual de Consumo por Submercado")
             st.dataframe(consumo_por_sub, hide_index=True)
         
-        # Detalhamento por unidade
+        # Detalhamento por unidade: primeira linha de cada unidade (na ordem em que aparecem) e consumo médio, em uma passada
         if "SIGLA_PARCELA_CARGA" in df_ultimos_12_meses.columns:
-            dados_unidades = []
-            unidades = df_ultimos_12_meses["SIGLA_PARCELA_CARGA"].unique()
+            df_unidades = df_ultimos_12_meses.dropna(subset=["SIGLA_PARCELA_CARGA"])
+            primeiras_linhas = df_unidades.drop_duplicates("SIGLA_PARCELA_CARGA")
+            tabela_unidades = pd.DataFrame({"Unidade": primeiras_linhas["SIGLA_PARCELA_CARGA"].to_numpy()})
             
-            for unidade in unidades:
-                df_unidade = df_ultimos_12_meses[df_ultimos_12_meses["SIGLA_PARCELA_CARGA"] == unidade]
-                
-                if not df_unidade.empty:
-                    try:
-                        info_unidade = {
-                            "Unidade": unidade
-                        }
-                        
-                        # Adicionar informações disponíveis
-                        for campo, col in [
-                            ("CNPJ", "CNPJ_CARGA"),
-                            ("Cidade", "CIDADE"),
-                            ("Estado", "ESTADO_UF"),
-                            ("Submercado", "SUBMERCADO"),
-                            ("Data de Migração", "DATA_MIGRACAO"),
-                            ("Demanda", "CAPACIDADE_CARGA")
-                        ]:
-                            if col in df_unidade.columns:
-                                info_unidade[campo] = df_unidade[col].iloc[0]
-                            else:
-                                info_unidade[campo] = "N/D"
-                                
-                        # Calcular consumo médio se disponível
-                        if "CONSUMO_MWm" in df_unidade.columns:
-                            info_unidade["Consumo 12m (MWm)"] = round(df_unidade["CONSUMO_MWm"].mean(), 2)
-                        else:
-                            info_unidade["Consumo 12m (MWm)"] = "N/D"
-                        
-                        dados_unidades.append(info_unidade)
-                    except Exception as e:
-                        st.warning(f"Erro ao processar unidade {unidade}: {e}")
+            # Adicionar informações disponíveis
+            for campo, col in [
+                ("CNPJ", "CNPJ_CARGA"),
+                ("Cidade", "CIDADE"),
+                ("Estado", "ESTADO_UF"),
+                ("Submercado", "SUBMERCADO"),
+                ("Data de Migração", "DATA_MIGRACAO"),
+                ("Demanda", "CAPACIDADE_CARGA")
+            ]:
+                tabela_unidades[campo] = primeiras_linhas[col].to_numpy() if col in primeiras_linhas.columns else "N/D"
+            
+            # Calcular consumo médio se disponível
+            if "CONSUMO_MWm" in df_unidades.columns:
+                consumo_unidades = df_unidades.groupby("SIGLA_PARCELA_CARGA", observed=True, sort=False)["CONSUMO_MWm"].mean().round(2)
+                tabela_unidades["Consumo 12m (MWm)"] = consumo_unidades.reindex(primeiras_linhas["SIGLA_PARCELA_CARGA"]).to_numpy()
+            else:
+                tabela_unidades["Consumo 12m (MWm)"] = "N/D"
             
-            if dados_unidades:
-                tabela_unidades = pd.DataFrame(dados_unidades)
+            if not tabela_unidades.empty:
                 st.write("🏭 Ver Detalhamento por Unidade")
                 st.dataframe(tabela_unidades, hide_index=True)
 